@@ -1,11 +1,43 @@
 import os
+import re
+import threading
+import time
 import requests
 import json
+from concurrent.futures import Future
 from typing import Optional, List
+from requests.adapters import HTTPAdapter
 from agno.tools import Toolkit
 from dotenv import load_dotenv
+from storage import ensure_schema, get_db
+import tracing
 
 load_dotenv(override=True)
+
+SEARCH_URL = os.getenv("SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
+SEARCH_TIMEOUT = 10  # seconds
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 3 * 24 * 60 * 60))  # claims repeat across a news cycle
+SEARCH_CACHE_MAX_AGE = 30 * 24 * 60 * 60  # expired entries are kept this long as a fallback when out of quota
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS search_cache (
+    query_key  TEXT PRIMARY KEY,
+    results    TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+""")
+
+# One pooled session for every search made by this worker
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+def normalize_query(query):
+    """Case, whitespace and surrounding punctuation don't change what Google returns, so ignore them in the key."""
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.strip(" .,;:!?\"'")
+
+
 class GoogleSearchToolkit(Toolkit):
     """
     Google Search Tool using Custom Search JSON API.
@@ -17,6 +49,10 @@ class GoogleSearchToolkit(Toolkit):
         if not self.api_key or not self.cse_id:
             raise ValueError("GOOGLE_SEARCH_API_KEY and GOOGLE_CSE_ID must be set.")
 
+        # In-flight searches by query key, so identical concurrent queries share one request
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
         tools = [self.google_search]
         super().__init__(name="google_search_tool", tools=tools)
 
@@ -28,19 +64,66 @@ class GoogleSearchToolkit(Toolkit):
         Returns:
             str: Formatted string of top search results.
         """
+        key = normalize_query(query)
+        cached = self._cached(key)
+        if cached and time.time() - cached[1] < SEARCH_CACHE_TTL:
+            print(f"[GoogleSearchTool] Cache hit for: {query}")
+            return cached[0]
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._search(query, key, stale=cached)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def has_results(self, query: str) -> bool:
+        """True if a search for this query has succeeded; failed searches return error JSON instead."""
+        return self._cached(normalize_query(query)) is not None
+
+    def _cached(self, key):
+        row = get_db().execute(
+            "SELECT results, fetched_at FROM search_cache WHERE query_key = ?", (key,)
+        ).fetchone()
+        return (row["results"], row["fetched_at"]) if row else None
+
+    def _search(self, query, key, stale=None):
         print(f"[GoogleSearchTool] Searching for: {query}")
+        tracing.record_search_call()
 
-        response = requests.get(
-            "https://www.googleapis.com/customsearch/v1",
-            params={
-                "key": self.api_key,
-                "cx": self.cse_id,
-                "q": query,
-                "num": 5 # Limit to top 5 results
-            }
-        )
+        try:
+            response = session.get(
+                SEARCH_URL,
+                params={
+                    "key": self.api_key,
+                    "cx": self.cse_id,
+                    "q": query,
+                    "num": 5 # Limit to top 5 results
+                },
+                timeout=SEARCH_TIMEOUT
+            )
+        except requests.exceptions.RequestException as e:
+            if stale:
+                return stale[0]
+            return json.dumps({"error": f"Search failed: {e}"})
 
         if response.status_code != 200:
+            # Out of quota (or Google is down): an old answer beats no answer
+            if stale:
+                print(f"[GoogleSearchTool] Search failed ({response.status_code}), using stale results for: {query}")
+                return stale[0]
             return json.dumps({
                 "error": f"Search failed: {response.status_code}",
                 "details": response.text
@@ -55,4 +138,12 @@ class GoogleSearchToolkit(Toolkit):
                 "snippet": item.get("snippet")
             })
 
-        return json.dumps(formatted, indent=2)
+        output = json.dumps(formatted, indent=2)
+        now = time.time()
+        db = get_db()
+        db.execute(
+            "INSERT OR REPLACE INTO search_cache (query_key, results, fetched_at) VALUES (?, ?, ?)",
+            (key, output, now)
+        )
+        db.execute("DELETE FROM search_cache WHERE fetched_at < ?", (now - SEARCH_CACHE_MAX_AGE,))
+        return output
@@ -1,13 +1,26 @@
 import os
 import json
+import concurrent.futures
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
+import llm as llm_gateway
+import claim_store
+import tracing
 from agents.google_search_tool import GoogleSearchToolkit
 import re
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
+# "agent": one agno agent loop that searches claim by claim.
+# "parallel": extract claims in one call, then search + judge each claim concurrently.
+MISINFO_MODE = os.getenv("MISINFO_MODE", "agent")
+CLAIM_CONCURRENCY = int(os.getenv("CLAIM_CONCURRENCY", 8))  # claims verified at once, across all jobs
+VERDICTS = ("Supported", "Disputed", "Unverified")
+CHECK_FAILED = "The claim could not be checked."  # justification of claims whose check raised
+
+claim_executor = concurrent.futures.ThreadPoolExecutor(max_workers=CLAIM_CONCURRENCY, thread_name_prefix="claim")
+
 llm = OpenAIChat(id="gpt-4o", api_key=os.getenv("OPENAI_API_KEY"), temperature=0)
 google_search_tool = GoogleSearchToolkit()
 
@@ -65,9 +78,52 @@ def clean_json_response(raw_response):
     cleaned = cleaned.strip()
     return cleaned
 
+def _metric_total(value):
+    # agno reports run metrics either as totals or as one value per model call
+    if isinstance(value, list):
+        return sum(v or 0 for v in value)
+    return int(value or 0)
+
 def verify_claims_with_agent(text):
+    """
+    Extracts the article's claims and reuses stored verdicts for the ones checked before; the
+    agent only verifies the rest. If extraction fails the agent checks the whole article.
+    """
     try:
-        response = agent.run(f"Verify factual claims in this article:\n\n{text}")
+        claims = extract_claims(text)
+    except Exception as e:
+        print("Claim extraction error, letting the agent find claims:", e)
+        return run_agent(f"Verify factual claims in this article:\n\n{text}")
+
+    known, new = [], []
+    for claim in claims:
+        verdict = claim_store.lookup(claim["claim-query"])
+        if verdict:
+            known.append({**claim, **verdict})
+        else:
+            new.append(claim)
+    print(f"[MisinfoAgent] {len(known)} of {len(claims)} claims already checked")
+    if not new:
+        return known
+
+    checked = run_agent(
+        f"Verify only these claims from the article below:\n{json.dumps(new, indent=2)}\n\n"
+        f"Article:\n\n{text}"
+    )
+    if isinstance(checked, dict):
+        return checked
+    return known + checked
+
+def run_agent(prompt):
+    try:
+        with tracing.span("agent"):
+            response = agent.run(prompt)
+            run_metrics = getattr(response, "metrics", None)
+            if isinstance(run_metrics, dict):
+                tracing.record_llm_usage(
+                    "gpt-4o", _metric_total(run_metrics.get("input_tokens")),
+                    _metric_total(run_metrics.get("output_tokens"))
+                )
 
         # Raw response (should be JSON)
         result = clean_json_response(response.content.strip())
@@ -96,8 +152,95 @@ def verify_claims_with_agent(text):
 
         print(formatted_data)
 
+        for entry in formatted_data:
+            # Verdicts reached without search results (e.g. out of quota) aren't worth keeping
+            if not google_search_tool.has_results(entry["claim-query"]):
+                continue
+            try:
+                claim_store.remember(entry["claim-query"], entry["verdict"], entry["justification"], entry["source"])
+            except Exception as e:
+                print("Claim store error:", e)
+
         return formatted_data
 
     except Exception as e:
         print("Agent verification error:", e)
-        return []
\ No newline at end of file
+        return {"error": f"Claim verification failed: {e}"}
+
+def complete_json(system_prompt, user_message):
+    output = llm_gateway.chat(
+        "gpt-4o",
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ],
+        temperature=0,
+        max_tokens=1500,
+        response_format={"type": "json_object"}
+    )
+    return json.loads(output)
+
+def extract_claims(text):
+    """Phase one: pull every checkable claim out of the article in a single call."""
+    data = complete_json(llm_gateway.load_prompt("claim_extraction_message.txt"), f"Extract factual claims from this article:\n\n{text}")
+    claims = []
+    for entry in data.get("claims", []):
+        if isinstance(entry, dict) and entry.get("claim-query") and entry.get("original-passage"):
+            claims.append({
+                "claim-query": entry["claim-query"].strip(),
+                "original-passage": entry["original-passage"].strip()
+            })
+    return claims
+
+def verify_claim(claim):
+    """Phase two, for one claim: reuse a stored verdict, or search and have the model judge the results."""
+    try:
+        known = claim_store.lookup(claim["claim-query"])
+        if known:
+            return {**claim, **known}
+        if llm_gateway.deadline_passed():
+            # The job has timed out; don't spend search quota on a result nobody will see
+            raise TimeoutError("The analysis deadline has passed.")
+        search_results = google_search_tool.google_search(claim["claim-query"])
+        if not google_search_tool.has_results(claim["claim-query"]):
+            # Search failed (e.g. out of quota); a verdict from the error message isn't one to show or keep
+            raise RuntimeError(f"Search failed for: {claim['claim-query']}")
+        data = complete_json(
+            llm_gateway.load_prompt("claim_verdict_message.txt"),
+            f"Claim: {claim['claim-query']}\n\nSearch results:\n{search_results}"
+        )
+        verdict = str(data.get("verdict", "")).strip().capitalize()
+        checked = {
+            "verdict": verdict if verdict in VERDICTS else "Unverified",
+            "justification": str(data.get("justification", "")).strip(),
+            "source": str(data.get("source") or "No relevant source found").strip()
+        }
+        claim_store.remember(claim["claim-query"], **checked)
+        return {**claim, **checked}
+    except Exception as e:
+        print("Claim verification error:", e)
+        return {**claim, "verdict": "Unverified", "justification": CHECK_FAILED,
+                "source": "No relevant source found"}
+
+def verify_candidate_claims(claims):
+    """Verifies already-extracted claims ({"claim-query", "original-passage"}) concurrently."""
+    print(f"[MisinfoAgent] Verifying {len(claims)} claims in parallel")
+    futures = [tracing.submit(claim_executor, verify_claim, claim) for claim in claims]
+    return [future.result() for future in futures]
+
+def verify_claims_parallel(text):
+    """Same output as verify_claims_with_agent, but claims are searched and judged concurrently."""
+    try:
+        return verify_candidate_claims(extract_claims(text))
+    except Exception as e:
+        print("Parallel verification error:", e)
+        return {"error": f"Claim verification failed: {e}"}
+
+def verify_claims(text):
+    """
+    Entry point for the pipeline; picks the verification strategy from MISINFO_MODE.
+    Returns the checked claims, or {"error": ...} if they could not be extracted or checked.
+    """
+    if MISINFO_MODE == "parallel":
+        return verify_claims_parallel(text)
+    return verify_claims_with_agent(text)
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import re
+import time
+import unicodedata
+
+from storage import ensure_schema, get_db, transaction
+
+CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", 24 * 60 * 60))  # finished results are reused for a day
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", 5000))
+INFLIGHT_TIMEOUT = 15 * 60  # a running job older than this is treated as abandoned (e.g. its worker died)
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    article_key TEXT PRIMARY KEY,
+    job_id      TEXT NOT NULL,
+    status      TEXT NOT NULL,          -- 'queued' / 'background' (pre-analysis waiting / running), 'running' or 'done'
+    created_at  REAL NOT NULL,
+    last_used   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analysis_cache_last_used ON analysis_cache (last_used);
+CREATE TABLE IF NOT EXISTS url_articles (
+    url         TEXT PRIMARY KEY,
+    article_key TEXT NOT NULL,
+    created_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS url_articles_created_at ON url_articles (created_at);
+""")
+
+
+def normalize_text(text):
+    """Normalizes unicode and whitespace so trivially different copies of an article hash the same."""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def article_key(text):
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def claim_job(key, job_id, is_available=None, background=False):
+    """
+    Looks up the analysis for `key`, or registers `job_id` as the one computing it.
+    Returns (job_id, is_new). When is_new is False the caller should reuse the returned
+    job instead of starting its own; it may still be running.
+    `is_available(job_id)` can reject finished entries whose result has gone missing.
+    Background jobs are registered as 'queued': a regular submission takes the article over
+    from them instead of waiting behind the background queue, and start_queued_job tells the
+    background job whether it still has to run.
+    """
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT job_id, status, created_at FROM analysis_cache WHERE article_key = ?", (key,)
+        ).fetchone()
+        if row and _reusable(row, now, is_available, include_queued=background):
+            conn.execute("UPDATE analysis_cache SET last_used = ? WHERE article_key = ?", (now, key))
+            return row["job_id"], False
+
+        conn.execute(
+            "INSERT OR REPLACE INTO analysis_cache (article_key, job_id, status, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, job_id, "queued" if background else "running", now, now),
+        )
+        return job_id, True
+
+
+def start_queued_job(key, job_id):
+    """Marks a queued background job as running; False if a regular submission took the article over."""
+    cursor = get_db().execute(
+        "UPDATE analysis_cache SET status = 'background', created_at = ? "
+        "WHERE article_key = ? AND job_id = ? AND status = 'queued'",
+        (time.time(), key, job_id),
+    )
+    return cursor.rowcount == 1
+
+
+def _reusable(row, now, is_available, include_queued=False):
+    age = now - row["created_at"]
+    if row["status"] == "queued":
+        return include_queued and age < CACHE_TTL
+    if row["status"] in ("running", "background"):
+        return age < INFLIGHT_TIMEOUT
+    return age < CACHE_TTL and (is_available is None or is_available(row["job_id"]))
+
+
+def normalize_url(url):
+    url = url.strip()
+    if not url.startswith("http"):
+        url = "https://" + url.lstrip(":/")
+    scheme, _, rest = url.partition("://")
+    host, slash, path = rest.partition("/")
+    return f"{scheme.lower()}://{host.lower()}{slash}{path.split('#')[0]}"
+
+
+def remember_url(url, key):
+    """Records which article text a URL produced, so pre-analyses of it can be found by URL."""
+    get_db().execute(
+        "INSERT OR REPLACE INTO url_articles (url, article_key, created_at) VALUES (?, ?, ?)",
+        (normalize_url(url), key, time.time()),
+    )
+
+
+def _url_job(url):
+    return get_db().execute(
+        "SELECT c.job_id, c.status, c.created_at FROM url_articles u "
+        "JOIN analysis_cache c ON c.article_key = u.article_key "
+        "WHERE u.url = ? AND u.created_at > ?",
+        (normalize_url(url), time.time() - CACHE_TTL),
+    ).fetchone()
+
+
+def find_url_job(url, is_available=None):
+    """Returns any job (finished, running or queued) for an article recently scraped from `url`, or None."""
+    row = _url_job(url)
+    if row and _reusable(row, time.time(), is_available, include_queued=True):
+        return row["job_id"]
+    return None
+
+
+def find_preanalysis(url):
+    """
+    Returns the running pre-analysis of the article just scraped from `url`, or None. Only these
+    skip the fetch: the page may have changed since any other analysis, and re-fetching it is a
+    conditional GET, so the article's text decides whether an earlier result still applies.
+    """
+    row = _url_job(url)
+    if row and row["status"] == "background" and _reusable(row, time.time(), None):
+        return row["job_id"]
+    return None
+
+
+def complete_job(key, job_id):
+    """Marks the job's result as reusable and evicts expired / excess entries."""
+    now = time.time()
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE analysis_cache SET status = 'done', created_at = ?, last_used = ? "
+            "WHERE article_key = ? AND job_id = ?",
+            (now, now, key, job_id),
+        )
+        _evict(conn, now)
+
+
+def release_job(key, job_id):
+    """Drops the claim of a job that failed so the next submission starts fresh."""
+    get_db().execute("DELETE FROM analysis_cache WHERE article_key = ? AND job_id = ?", (key, job_id))
+
+
+def _evict(conn, now):
+    conn.execute("DELETE FROM url_articles WHERE created_at < ?", (now - CACHE_TTL,))
+    conn.execute("DELETE FROM analysis_cache WHERE status = 'done' AND created_at < ?", (now - CACHE_TTL,))
+    conn.execute(
+        "DELETE FROM analysis_cache WHERE status = 'done' AND article_key NOT IN "
+        "(SELECT article_key FROM analysis_cache WHERE status = 'done' ORDER BY last_used DESC LIMIT ?)",
+        (CACHE_MAX_ENTRIES,),
+    )
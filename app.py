@@ -1,109 +1,85 @@
-import html
-import io
 import uuid, json, os
+import threading
 import re
 from dotenv import load_dotenv
-from flask import Flask, request, render_template, redirect, url_for, jsonify
-import requests
+from flask import Flask, Response, request, render_template, redirect, url_for, jsonify, stream_with_context
 import time
-from openai import OpenAI, BadRequestError
+from openai import BadRequestError
 from bs4 import BeautifulSoup
 from newspaper import Article
 import concurrent.futures
-from threading import Thread
 from agents.misinfo_agent import agent
-from agents.misinfo_agent import verify_claims_with_agent
-import psutil
-
-import PyPDF2
-from docx import Document
-
-import concurrent.futures
-
-task_status = {}
-
-# Define this at the top so you can reuse it easily
-def log_memory_usage(label=""):
-    process = psutil.Process(os.getpid())
-    mem_mb = process.memory_info().rss / 1024 ** 2
-    print(f"[MEMORY] {label}: {mem_mb:.2f} MB")
-
-def run_with_timeout(func, *args, timeout=40):
-    """Safely run a function with a time limit (in seconds)."""
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future = executor.submit(func, *args)
-        try:
-            return future.result(timeout=timeout)
-        except concurrent.futures.TimeoutError:
-            print(f"Timeout reached for {func.__name__}")
-            return {"error": f"{func.__name__} took too long. Please try a shorter article."}
-
+from agents.misinfo_agent import CHECK_FAILED, extract_claims, verify_claims, verify_candidate_claims
+import analysis_cache
+import paragraph_cache
+import llm
+import job_store
+import results_store
+import headlines
+from headlines import get_trusted_headlines, start_refresher
+import preanalysis
+from scheduler import JobScheduler, QueueFullError
+from pipeline import Stage, run_stages
+from highlights import apply_combined_highlights, apply_edits, locate_passages, normalize_passage
+from chunking import split_into_chunks, count_tokens, merge_bias_results, dedupe_claims
+import metrics
+import tracing
+
+from extractors import ExtractionError, MAX_UPLOAD_BYTES, extract_upload
+from fetcher import FetchError, fetch_page
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))  # concurrent analyses per gunicorn worker
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 20))
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", 180))  # seconds from submission, including time in the queue
+# Extra seconds per chunk after the first: a long document's chunk calls share the chunk pool with other jobs
+JOB_TIMEOUT_PER_CHUNK = int(os.getenv("JOB_TIMEOUT_PER_CHUNK", 30))
+
+scheduler = JobScheduler(
+    workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE, job_timeout=JOB_TIMEOUT,
+    on_queue_change=job_store.set_queue_positions,
+    background_limit=preanalysis.PREANALYZE_CONCURRENCY,
+)
+# Shared by all jobs for their LLM calls instead of a new pool per job
+stage_executor = concurrent.futures.ThreadPoolExecutor(max_workers=JOB_WORKERS * 4, thread_name_prefix="stage")
+# Per-chunk calls made from inside a stage; a separate pool so stages never wait on their own pool
+chunk_executor = concurrent.futures.ThreadPoolExecutor(max_workers=JOB_WORKERS * 4, thread_name_prefix="chunk")
 
 load_dotenv(override=True)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-MAX_WORDS = 5000  # Limit for summarization
-
-app = Flask(__name__)
-
-USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0.0.0 Safari/537.36"
-
-cached_news = None
-last_fetched = 0
-CACHE_DURATION = 15 * 60  # 15 minutes in seconds
+MAX_WORDS = 20000  # Longer inputs are truncated; roughly 40 pages
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 1500))  # longer texts are analyzed in chunks of this size, in parallel
 
-def get_trusted_headlines():
-    global cached_news, last_fetched
-    now = time.time()
+# "staged" makes one call per analysis stage; "fused" gets the summary, bias and candidate
+# claims from a single structured gpt-4o call and only makes the rewrite and claim checks separately
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "staged")
 
-    if cached_news and (now - last_fetched) < CACHE_DURATION:
-        return cached_news
+# "rewrite" has the model reprint the whole article; "edits" asks only for a replacement per
+# biased passage and applies them locally, so the call's length follows the passage count
+UNBIAS_MODE = os.getenv("UNBIAS_MODE", "rewrite")
+EDIT_CONTEXT_CHARS = 200  # article text shown on each side of a passage being reworded
+EDIT_OVERHEAD_TOKENS = 30  # JSON around each replacement in the edits response
 
-    api_key = os.getenv("NEWS_API_KEY")
-    base_url = "https://newsdata.io/api/1/latest"
+# Reuse stored per-paragraph bias and claim results so re-submissions of a URL only re-check changed paragraphs
+INCREMENTAL_ANALYSIS = os.getenv("INCREMENTAL_ANALYSIS", "0") == "1"
 
-    trusted_sources = "bbc.com,reuters.com,forbes.com,wsj.com"
+STREAM_PARTIALS = os.getenv("STREAM_PARTIALS", "1") == "1"  # show summary/rewrite on the loading page as tokens arrive
 
-    params = {
-        "domainurl": trusted_sources,
-        "language": "en",
-        "country": "us",
-        "category": "top",
-        "size": 10,
-        "apikey": api_key
-    }
+app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 1024 * 1024  # room for the form fields around the file
 
+def scrape_with_newspaper_or_fallback(url):
+    # Download once; both extraction strategies work on the same HTML
+    if not url.startswith("http"):
+        url = "https://" + url.lstrip(":/")
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        articles = data.get("results", [])
-
-        last_fetched = now
-        cached_news = [
-            {
-                "title": article["title"],
-                "source": article["source_name"],
-                "url": article["link"],
-                "image": article["image_url"]
-            }
-            for article in articles if article["image_url"]
-        ]
-
-        return cached_news
-
-    except requests.exceptions.RequestException as e:
-        print("NewsAPI Request Error:", e)
-        return []
+        page = fetch_page(url)
+    except FetchError as e:
+        print("Fetching article failed:", e)
+        return ""
 
-def scrape_with_newspaper_or_fallback(url):
     try:
-        if not url.startswith("http"):
-            url = "https://" + url.lstrip(":/")
         article = Article(url)
-        article.download()
+        article.download(input_html=page)
         article.parse()
         if article.text.strip():
             return article.text
@@ -112,37 +88,30 @@ def scrape_with_newspaper_or_fallback(url):
 
     # fallback to BeautifulSoup
     try:
-        headers = {"User-Agent": USER_AGENT}
-        resp = requests.get(url, headers=headers, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, 'html.parser')
+        soup = BeautifulSoup(page, 'html.parser')
         paragraphs = soup.find_all('p')
         return ''.join(p.get_text() for p in paragraphs if p.get_text(strip=True))
     except Exception as e:
-        print("Requests + BS4 scraping failed:", e)
+        print("BS4 scraping failed:", e)
         return ""
 
-def summarize_article(text):
+def summarize_article(text, on_partial=None):
     global current_step
     current_step = "Summarizing content..."
-    text_file_path = 'prompts/summary_message.txt'
-    with open(text_file_path, 'r') as file:
-            initial_prompt = file.read()
+    initial_prompt = llm.load_prompt("summary_message.txt")
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
+        return llm.chat(
+            "gpt-4",
+            [
                 {"role": "system", "content": initial_prompt},
                 {"role": "user", "content": "Summarize the following article:\n\n" + text}
             ],
+            on_partial=on_partial,
             temperature=0,
             top_p=1,
             max_tokens=800
         )
-
-        output = response.choices[0].message.content.strip()
-        return output
     
     except BadRequestError as e:
         if e.code == "context_length_exceeded":
@@ -154,16 +123,14 @@ def summarize_article(text):
 def determine_bias(text):
     global current_step
     current_step = "Identifying bias..."
-    text_file_path = 'prompts/bias_message.txt'
-    with open(text_file_path, 'r') as file:
-            initial_prompt = file.read()
+    initial_prompt = llm.load_prompt("bias_message.txt")
 
     user_message = f"Analyze the following text for bias and provide a bias score:\n\n{text}"
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages = [
+        output = llm.chat(
+            "gpt-4",
+            [
                 {"role": "system", "content": initial_prompt},
                 {"role": "user", "content": user_message}
             ],
@@ -171,8 +138,6 @@ def determine_bias(text):
             top_p=1,
             max_tokens=1500
         )
-
-        output = response.choices[0].message.content.strip()
         return json.loads(output)
     except BadRequestError as e:
         if e.code == "context_length_exceeded":
@@ -181,84 +146,23 @@ def determine_bias(text):
         print(e)
         return {"error": "An error occurred while processing the request."}
 
-def apply_combined_highlights(text, bias_passages, misinfo_claims):
-    spans = []
-
-    # Collect bias highlights
-    for b in bias_passages:
-        passage = b["passage"].strip()
-        if passage in text:
-            spans.append({
-                "type": "bias",
-                "passage": passage,
-                "reason": b["reasoning"].strip()
-            })
-
-    # Collect misinformation highlights
-    print(misinfo_claims)
-    for m in misinfo_claims:
-        claim = m["original-passage"].strip()
-        print(claim)
-        if claim in text:
-            print("Made it through")
-            spans.append({
-                "type": "misinfo",
-                "passage": claim,
-                "verdict": m["verdict"].strip(),
-                "reason": f"{m['verdict']}: {m['justification']}",
-                "source": m.get("source", "").strip()
-            })
-
-    # Avoid overlapping inserts: sort by first occurrence index
-    def start_index(span):
-        return text.find(span["passage"])
-
-    spans = sorted(spans, key=start_index)
-    print(spans)
-
-    # Track modified positions to avoid re-highlighting same passage
-    modified = set()
-    for span in spans:
-        passage = span["passage"]
-        if passage in modified:
-            continue  # Already replaced
-        reason = html.escape(span["reason"])
-        escaped_passage = html.escape(passage)
-
-        if span["type"] == "bias":
-            tag = f'<span class="highlight bias" data-reason="{reason}">{escaped_passage}</span>'
-        else:
-            src = span.get("source", "")
-            if ("http" in src):
-                tag = f'<span class="highlight misinfo {span["verdict"].lower()}" data-reason="{reason}"><a href="{span["source"]}" target="_blank">{escaped_passage}</a></span>'
-            else:
-                tag = f'<span class="highlight misinfo {span["verdict"].lower()}" data-reason="{reason}">{escaped_passage}</span>'
-        text = text.replace(passage, tag, 1)
-        modified.add(passage)
-
-    return text
-
-def unbias(text, highlighted_passages):
+def unbias(text, highlighted_passages, on_partial=None):
     global current_step
     current_step = "Rewriting text in an unbiased form..."
-    text_file_path = 'prompts/unbias_message.txt'
-    with open(text_file_path, 'r') as file:
-        initial_prompt = file.read()
+    initial_prompt = llm.load_prompt("unbias_message.txt")
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
+        return llm.chat(
+            "gpt-4",
+            [
                 {"role": "system", "content": initial_prompt},
                 {"role": "user", "content": f"Biased Phrases: {highlighted_passages}\n\nArticle:\n{text}"}
             ],
+            on_partial=on_partial,
             temperature=0,
             top_p=1,
             max_tokens=1500
         )
-        
-        output = response.choices[0].message.content.strip()
-        return output
     except BadRequestError as e:
         if e.code == "context_length_exceeded":
             return {"error": f"Input is too large. Please limit input to {MAX_WORDS} words or fewer."}
@@ -266,136 +170,710 @@ def unbias(text, highlighted_passages):
         print(e)
         return {"error": "An error occurred while processing the request."}
 
-# --- Routes ---
+_PASSAGES_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"passage": {"type": "string"}, "reasoning": {"type": "string"}},
+        "required": ["passage", "reasoning"],
+        "additionalProperties": False
+    }
+}
+
+_CLAIMS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"claim-query": {"type": "string"}, "original-passage": {"type": "string"}},
+        "required": ["claim-query", "original-passage"],
+        "additionalProperties": False
+    }
+}
+
+FUSED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "article_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "summary": {"type": "string"},
+                "bias_score": {"type": "number"},
+                "rubric_justification": {
+                    "type": "object",
+                    "properties": {
+                        "language_bias": {"type": "number"},
+                        "framing_bias": {"type": "number"},
+                        "sourcing_bias": {"type": "number"},
+                        "overall_reasoning": {"type": "string"}
+                    },
+                    "required": ["language_bias", "framing_bias", "sourcing_bias", "overall_reasoning"],
+                    "additionalProperties": False
+                },
+                "highlighted_passages": _PASSAGES_SCHEMA,
+                "claims": _CLAIMS_SCHEMA
+            },
+            "required": ["summary", "bias_score", "rubric_justification", "highlighted_passages", "claims"],
+            "additionalProperties": False
+        }
+    }
+}
 
-@app.route('/')
-def home():
-    headlines = get_trusted_headlines()
-    return render_template('index.html', trusted_articles=headlines)
+def fused_analysis(text):
+    """Summary, bias score, rubric, biased passages and candidate claims from one structured call."""
+    try:
+        output = llm.chat(
+            "gpt-4o",
+            [
+                {"role": "system", "content": llm.load_prompt("fused_message.txt")},
+                {"role": "user", "content": f"Analyze the following article:\n\n{text}"}
+            ],
+            temperature=0,
+            top_p=1,
+            max_tokens=3000,
+            response_format=FUSED_RESPONSE_FORMAT
+        )
+        return json.loads(output)
+    except BadRequestError as e:
+        if e.code == "context_length_exceeded":
+            return {"error": f"Input is too large. Please limit input to {MAX_WORDS} words or fewer."}
+        print(e)
+        return {"error": "An error occurred while processing the request."}
+    except Exception as e:
+        print(e)
+        return {"error": "An error occurred while processing the request."}
 
-RESULTS_DIR = "results"
-os.makedirs(RESULTS_DIR, exist_ok=True)
+def parse_edits(output):
+    """
+    The edits in an unbias_edits response. If the JSON was cut off or is malformed, returns the
+    complete edit objects that can be read, so one bad edit doesn't cost the whole rewrite.
+    """
+    try:
+        edits = json.loads(output).get("edits", [])
+        return [edit for edit in edits if isinstance(edit, dict)]
+    except (ValueError, AttributeError) as e:
+        print("Unbias edits response was not valid JSON; keeping the complete edits:", e)
+    decoder, edits = json.JSONDecoder(), []
+    for match in re.finditer(r'\{\s*"id"', output):
+        try:
+            edit, _ = decoder.raw_decode(output, match.start())
+        except ValueError:
+            continue
+        if isinstance(edit, dict):
+            edits.append(edit)
+    return edits
+
+def unbias_edits(text, highlighted_passages, on_partial=None):
+    """Rewrites only the biased passages and splices the replacements into the original text."""
+    occurrences = locate_passages(text, [p["passage"] for p in highlighted_passages])
+    listed = []
+    # Replacements run about as long as the passages; allow twice that so none is cut off
+    max_tokens = 50
+    for i, (passage, found) in enumerate(zip(highlighted_passages, occurrences)):
+        if not found:
+            continue
+        start, end = found[0]
+        context = text[max(0, start - EDIT_CONTEXT_CHARS):end + EDIT_CONTEXT_CHARS]
+        listed.append(f"{i}. Passage: {passage['passage']}\nReason: {passage['reasoning']}\nContext: ...{context}...")
+        max_tokens += EDIT_OVERHEAD_TOKENS + 2 * count_tokens(passage["passage"])
+    if not listed:
+        if on_partial:
+            on_partial(text)
+        return text
 
-def process_article(job_id, raw_text):
-    """Runs the full analysis pipeline in a background thread with progress tracking."""
     try:
-        # Initialize progress
-        task_status[job_id] = {"done": False, "current_step": "Analyzing article..."}
+        output = llm.chat(
+            "gpt-4o",
+            [
+                {"role": "system", "content": llm.load_prompt("unbias_edits_message.txt")},
+                {"role": "user", "content": "Biased passages:\n\n" + "\n\n".join(listed)}
+            ],
+            temperature=0,
+            top_p=1,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        print(e)
+        return {"error": "An error occurred while processing the request."}
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            # --- Step 1: Summarize and detect bias ---
-            task_status[job_id]["current_step"] = "Summarizing content..."
-            future_summary = executor.submit(summarize_article, raw_text)
+    edits = []
+    for edit in parse_edits(output):
+        i = edit.get("id")
+        if isinstance(i, int) and 0 <= i < len(highlighted_passages) and isinstance(edit.get("replacement"), str):
+            edits.append((highlighted_passages[i]["passage"], edit["replacement"]))
+    unbiased = apply_edits(text, edits)
+
+    if on_partial:
+        on_partial(unbiased)
+    return unbiased
+
+def map_chunks(func, chunks, *args):
+    """Runs func(chunk, *args) for every chunk in parallel and returns the outputs in order."""
+    futures = [tracing.submit(chunk_executor, func, chunk, *args) for chunk in chunks]
+    return [check_stage_output(f.result()) for f in futures]
+
+def chunk_partials(on_partial, count):
+    """Per-chunk on_partial callbacks that report the chunks' texts joined together."""
+    if on_partial is None:
+        return [None] * count
+    parts = [""] * count
+
+    def writer(i):
+        def write(text):
+            parts[i] = text
+            on_partial("\n\n".join(p for p in parts if p))
+        return write
+    return [writer(i) for i in range(count)]
+
+def summarize_long_article(text, on_partial=None):
+    """Summarizes each chunk in parallel, then summarizes the chunk summaries."""
+    chunks = split_into_chunks(text, CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        return summarize_article(text, on_partial)
+    summaries = map_chunks(summarize_article, chunks)
+    return summarize_article("\n\n".join(summaries), on_partial)
+
+def determine_bias_long(text):
+    """Runs bias detection per chunk in parallel and reconciles the results."""
+    chunks = split_into_chunks(text, CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        return determine_bias(text)
+    results = map_chunks(determine_bias, chunks)
+    return merge_bias_results(results, [count_tokens(c) for c in chunks])
+
+def unbias_long(text, highlighted_passages, on_partial=None):
+    """Rewrites each chunk in parallel with the biased passages found in it and joins the rewrites."""
+    if UNBIAS_MODE == "edits":
+        # Edits never reprint the article, so there is nothing to chunk
+        return unbias_edits(text, highlighted_passages, on_partial)
+    chunks = split_into_chunks(text, CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        return unbias(text, highlighted_passages, on_partial)
+    writers = chunk_partials(on_partial, len(chunks))
+    futures = []
+    for chunk, writer in zip(chunks, writers):
+        normalized_chunk = normalize_passage(chunk)
+        passages = [p for p in highlighted_passages if normalize_passage(p["passage"]) in normalized_chunk]
+        futures.append(tracing.submit(chunk_executor, unbias, chunk, passages, writer))
+    return "\n\n".join(check_stage_output(f.result()) for f in futures)
+
+def fused_analysis_long(text):
+    """Runs the fused call per chunk in parallel; the summaries are then summarized once more."""
+    chunks = split_into_chunks(text, CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        return fused_analysis(text)
+    results = map_chunks(fused_analysis, chunks)
+    bias = merge_bias_results(results, [count_tokens(c) for c in chunks])
+    return {
+        **bias,
+        "summary": check_stage_output(summarize_article("\n\n".join(r["summary"] for r in results))),
+        "claims": [claim for r in results for claim in r["claims"]]
+    }
 
-            task_status[job_id]["current_step"] = "Identifying bias..."
-            future_bias = executor.submit(determine_bias, raw_text)
+def verify_claims_long(text):
+    """
+    Extracts claims per chunk in parallel, drops claims reported twice and verifies the rest
+    concurrently. Long texts always take this path: an agent loop per chunk would take many
+    times as long as one chunk.
+    """
+    chunks = split_into_chunks(text, CHUNK_TOKENS)
+    if len(chunks) <= 1:
+        return verify_claims(text)
+    try:
+        claims = [claim for claims in map_chunks(extract_claims, chunks) for claim in claims]
+        return verify_candidate_claims(dedupe_claims(claims))
+    except Exception as e:
+        print("Chunked claim verification error:", e)
+        return {"error": f"Claim verification failed: {e}"}
+
+def job_timeout(raw_text):
+    """JOB_TIMEOUT plus JOB_TIMEOUT_PER_CHUNK for each extra chunk, within what the cache treats as in flight."""
+    chunks = -(-count_tokens(raw_text) // CHUNK_TOKENS)
+    return min(JOB_TIMEOUT + JOB_TIMEOUT_PER_CHUNK * max(0, chunks - 1), analysis_cache.INFLIGHT_TIMEOUT)
+
+def determine_bias_incremental(text, source_url):
+    """
+    Bias detection on changed paragraphs only, packed into chunks like determine_bias_long. Each
+    paragraph keeps its chunk's score and its own passages; the article score is a length-weighted
+    average over paragraphs.
+    """
+    def analyze(paragraphs):
+        packed = paragraph_cache.chunk_paragraphs(paragraphs, CHUNK_TOKENS)
+        results = map_chunks(determine_bias, [chunk for chunk, _ in packed])
+        scored, passages = {}, {}
+        for (chunk, keys), result in zip(packed, results):
+            assigned = paragraph_cache.assign_to_paragraphs(
+                result["highlighted_passages"], {key: paragraphs[key] for key in keys}, lambda p: p["passage"])
+            for key in keys:
+                scored.setdefault(key, []).append((result, count_tokens(chunk)))
+                passages.setdefault(key, []).extend(assigned[key])
+
+        fresh = {}
+        for key, chunk_scores in scored.items():
+            # A paragraph split across chunks averages their scores
+            fresh[key] = merge_bias_results([r for r, _ in chunk_scores], [w for _, w in chunk_scores])
+            fresh[key]["highlighted_passages"] = passages[key]
+        return fresh
+
+    return paragraph_cache.analyze_incrementally(
+        text, source_url, "bias", analyze,
+        lambda results, paragraphs: merge_bias_results(results, [count_tokens(p) for p in paragraphs])
+    )
+
+def verify_claims_incremental(text, source_url):
+    """
+    verify_claims_long on changed paragraphs only, reusing earlier verdicts for the rest.
+    Failed runs, and paragraphs with a claim that could not be checked, are not stored.
+    """
+    def analyze(paragraphs):
+        claims = check_stage_output(verify_claims_long("\n\n".join(paragraphs.values())))
+        return paragraph_cache.assign_to_paragraphs(claims, paragraphs, lambda c: c["original-passage"])
 
-            summary = future_summary.result()
-            bias = future_bias.result()
+    try:
+        return paragraph_cache.analyze_incrementally(
+            text, source_url, "claims", analyze,
+            lambda results, paragraphs: dedupe_claims([claim for claims in results for claim in claims]),
+            storable=lambda claims: all(claim.get("justification") != CHECK_FAILED for claim in claims)
+        )
+    except RuntimeError as e:
+        return {"error": str(e)}
 
-            # --- Step 2: Parallel misinformation + unbias ---
-            task_status[job_id]["current_step"] = "Looking for misinformation..."
-            future_misinfo = executor.submit(verify_claims_with_agent, raw_text)
+# --- Routes ---
 
-            task_status[job_id]["current_step"] = "Rewriting text in an unbiased form..."
-            future_unbias = executor.submit(unbias, raw_text, bias["highlighted_passages"])
+start_refresher()
+metrics.start_reporter(scheduler.stats, tracing.rss_bytes)
 
-            misinfo_verdicts = future_misinfo.result()
-            unbiased_text = future_unbias.result()
+@app.route('/')
+def home():
+    headlines = get_trusted_headlines()
+    return render_template('index.html', trusted_articles=headlines)
 
-        # --- Step 3: Combine results ---
-        task_status[job_id]["current_step"] = "Combining analysis results..."
-        highlighted_text = apply_combined_highlights(
-            raw_text, bias["highlighted_passages"], misinfo_verdicts
-        )
+def check_stage_output(output):
+    """Stage helpers report failures as {"error": ...}; turn those into exceptions so the job fails."""
+    if isinstance(output, dict) and "error" in output:
+        raise RuntimeError(output["error"])
+    return output
 
-        result = {
-            "summary": summary,
-            "original_text": raw_text,
-            "highlighted_text": highlighted_text,
-            "unbiased_text": unbiased_text,
-            "score": bias["bias_score"],
-            "rubric": bias["rubric_justification"]
-        }
+def found_claims(output):
+    """A failed claim check shows as no findings rather than failing the whole analysis."""
+    if isinstance(output, dict) and "error" in output:
+        print(output["error"])
+        return []
+    return output
+
+def build_pipeline(job_id, source_url=None):
+    """The analysis stages for one job; each starts as soon as the stages it depends on are done."""
+    def section_writer(section):
+        if not STREAM_PARTIALS:
+            return None
+        return lambda text: job_store.set_section(job_id, section, text)
+
+    if ANALYSIS_MODE == "fused":
+        # One call replaces the summary, bias and claim extraction calls; the others reuse its output
+        first_stages = [
+            Stage("fused", lambda text: check_stage_output(fused_analysis_long(text)),
+                  ("raw_text",), "Analyzing article..."),
+            Stage("summary", lambda fused: fused["summary"], ("fused",), "Summarizing content..."),
+            Stage("bias", lambda fused: fused, ("fused",), "Identifying bias..."),
+            Stage("misinfo", lambda fused: verify_candidate_claims(dedupe_claims(fused["claims"])),
+                  ("fused",), "Looking for misinformation..."),
+        ]
+    else:
+        find_bias, find_claims = determine_bias_long, verify_claims_long
+        if INCREMENTAL_ANALYSIS and source_url:
+            # Only articles submitted by URL have a source to tie paragraph results to
+            find_bias = lambda text: determine_bias_incremental(text, source_url)
+            find_claims = lambda text: verify_claims_incremental(text, source_url)
+        first_stages = [
+            Stage("summary", lambda text: check_stage_output(summarize_long_article(text, section_writer("summary"))),
+                  ("raw_text",), "Summarizing content..."),
+            Stage("bias", lambda text: check_stage_output(find_bias(text)),
+                  ("raw_text",), "Identifying bias..."),
+            Stage("misinfo", lambda text: found_claims(find_claims(text)),
+                  ("raw_text",), "Looking for misinformation..."),
+        ]
+
+    stages = first_stages + [
+        Stage("unbiased_text",
+              lambda text, bias: check_stage_output(
+                  unbias_long(text, bias["highlighted_passages"], section_writer("unbiased_text"))),
+              ("raw_text", "bias"), "Rewriting text in an unbiased form..."),
+        Stage("highlighted_text",
+              lambda text, bias, misinfo: apply_combined_highlights(text, bias["highlighted_passages"], misinfo),
+              ("raw_text", "bias", "misinfo"), "Combining analysis results..."),
+    ]
+    return [stage._replace(func=traced(SPAN_NAMES.get(stage.name, stage.name), stage.func)) for stage in stages]
+
+# Span names for the pipeline stages in traces and /metrics
+SPAN_NAMES = {"unbiased_text": "unbias", "highlighted_text": "highlight"}
+
+def traced(name, func):
+    def run(*args):
+        with tracing.span(name):
+            return func(*args)
+    return run
+
+def process_article(job_id, raw_text, cache_key=None, source_url=None, deadline=None):
+    """Runs the full analysis pipeline on a scheduler worker with progress tracking."""
+    deadline = deadline or time.time() + JOB_TIMEOUT
+    # Spans from the request that queued the job (scraping, extraction) belong to its trace
+    trace = tracing.current_trace() or tracing.Trace()
+    with tracing.activate(trace):
+        try:
+            with tracing.span("job"):
+                # Initialize progress
+                job_store.update_job(job_id, current_step="Analyzing article...", queue_position=None)
+                if time.time() >= deadline:
+                    raise TimeoutError("The server is busy and your article waited too long. Please try again.")
+
+                def show_progress(running):
+                    # Report the most recently started stage that is still running
+                    if running:
+                        job_store.update_job(job_id, current_step=running[-1].step)
+
+                # LLM calls in every stage, chunk and claim thread stop at the job's deadline
+                with llm.deadline_scope(deadline):
+                    outputs, timings = run_stages(
+                        build_pipeline(job_id, source_url), {"raw_text": raw_text}, stage_executor, deadline, show_progress
+                    )
+                bias = outputs["bias"]
+
+                result = {
+                    "summary": outputs["summary"],
+                    "original_text": raw_text,
+                    "highlighted_text": outputs["highlighted_text"],
+                    "unbiased_text": outputs["unbiased_text"],
+                    "score": bias["bias_score"],
+                    "rubric": bias["rubric_justification"],
+                    "timings": timings
+                }
+
+        except Exception as e:
+            result = {"error": str(e)}
+            job_store.update_job(job_id, current_step=f"Error: {e}")
+
+    result["spans"] = trace.records()
+
+    # --- Save result and mark done ---
+    results_store.save_result(job_id, result)
+
+    if cache_key:
+        if "error" in result:
+            analysis_cache.release_job(cache_key, job_id)
+        else:
+            analysis_cache.complete_job(cache_key, job_id)
+
+    job_store.update_job(job_id, done=True, current_step="Analysis complete.")
+    job_store.purge_old_jobs()
 
-    except Exception as e:
-        result = {"error": str(e)}
-        task_status[job_id]["current_step"] = f"Error: {e}"
 
-    # --- Step 4: Save result and mark done ---
-    with open(os.path.join(RESULTS_DIR, f"{job_id}.json"), "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+def start_analysis(raw_text, url=None, background=False):
+    """
+    Returns (job_id, is_new) for the analysis of raw_text, queueing a new job unless an
+    identical article is already analyzed or in progress. Raises QueueFullError.
+    """
+    job_id = str(uuid.uuid4())
 
-    task_status[job_id]["done"] = True
-    task_status[job_id]["current_step"] = "Analysis complete."
+    # Long texts are analyzed in chunks; only truncate truly huge inputs
+    words = raw_text.split()
+    if len(words) > MAX_WORDS:
+        raw_text = " ".join(words[:MAX_WORDS])
+
+    # Identical articles share one analysis: reuse a finished result or attach to the running job
+    cache_key = analysis_cache.article_key(raw_text)
+    if url:
+        analysis_cache.remember_url(url, cache_key)
+    cached_job_id, is_new = analysis_cache.claim_job(
+        cache_key, job_id, is_available=results_store.has_result, background=background
+    )
+    if not is_new:
+        return cached_job_id, False
+
+    job_store.create_job(job_id, current_step="Waiting in queue...")
+    try:
+        run = preanalyze_article if background else process_article
+        scheduler.submit(job_id, run, job_id, raw_text, cache_key, url, background=background,
+                         timeout=job_timeout(raw_text))
+    except QueueFullError:
+        analysis_cache.release_job(cache_key, job_id)
+        job_store.delete_job(job_id)
+        raise
+    return job_id, True
+
+def preanalyze_article(job_id, raw_text, cache_key, source_url=None, deadline=None):
+    """Runs a background job, unless a user submitted the same article while it was queued."""
+    if not analysis_cache.start_queued_job(cache_key, job_id):
+        job_store.delete_job(job_id)
+        preanalysis.refund_budget()
+        return
+    process_article(job_id, raw_text, cache_key, source_url, deadline=deadline)
+
+def preanalyze_url(url):
+    """Low-priority analysis of a feed article, so clicking it later is instant."""
+    with tracing.activate(tracing.Trace()):
+        with tracing.span("scrape"):
+            raw_text = scrape_with_newspaper_or_fallback(url)
+        if not raw_text:
+            return False
+        return start_analysis(raw_text, url=url, background=True)[1]
 
+if preanalysis.PREANALYZE_HEADLINES:
+    headlines.refresh_listeners.append(
+        lambda articles: preanalysis.preanalyze_headlines(articles, preanalyze_url, results_store.has_result)
+    )
 
 @app.route("/analyze", methods=["POST"])
 def analyze():
+    # Scraping and extraction spans are recorded here and saved with the job they lead to
+    with tracing.activate(tracing.Trace()):
+        return submit_article()
+
+def submit_article():
     pasted_text = request.form.get('article_text', '').strip()
     article_url = request.form.get('article_url', '').strip()
     uploaded_file = request.files.get('article_file')
     raw_text = ""
-    job_id = str(uuid.uuid4())
-
-    task_status[job_id] = {"done": False, "current_step": "Analyzing article..."}
 
     # Handle input sources (same as before)
     if pasted_text:
         raw_text = pasted_text
     elif article_url:
-        raw_text = scrape_with_newspaper_or_fallback(article_url)
+        # A URL being pre-analyzed right now joins that job; others are re-fetched (cheap if unchanged)
+        known_job_id = analysis_cache.find_preanalysis(article_url)
+        if known_job_id:
+            return redirect(url_for("result", job_id=known_job_id))
+        with tracing.span("scrape"):
+            raw_text = scrape_with_newspaper_or_fallback(article_url)
         if not raw_text:
             return render_template("index.html", error="Failed to extract article from URL.")
     elif uploaded_file and uploaded_file.filename != '':
-        filename = uploaded_file.filename.lower()
-        if filename.endswith('.txt'):
-            raw_text = uploaded_file.read().decode('utf-8')
-        elif filename.endswith('.pdf'):
-            pdf = PyPDF2.PdfReader(uploaded_file)
-            raw_text = "\n\n".join([p.extract_text() or "" for p in pdf.pages])
-        elif filename.endswith('.docx'):
-            docx_file = io.BytesIO(uploaded_file.read())
-            doc = Document(docx_file)
-            raw_text = "\n\n".join([para.text for para in doc.paragraphs if para.text.strip()])
-        else:
-            return render_template("index.html", error="Unsupported file type.")
+        try:
+            with tracing.span("extract"):
+                raw_text = extract_upload(uploaded_file.read(MAX_UPLOAD_BYTES + 1), uploaded_file.filename, MAX_WORDS)
+        except ExtractionError as e:
+            return render_template("index.html", error=str(e))
+        if not raw_text.strip():
+            return render_template("index.html", error="No text found in the uploaded file.")
     else:
         return render_template("index.html", error="No input detected.")
 
-    # Truncate to avoid overloading memory
-    words = raw_text.split()
-    if len(words) > 2000:
-        raw_text = " ".join(words[:2000])
+    # Queue the job; when the queue is full, tell the client when to come back
+    try:
+        job_id, is_new = start_analysis(raw_text, url=article_url or None)
+    except QueueFullError as e:
+        error = f"NewsSense is busy right now. Please try again in about {e.retry_after} seconds."
+        return render_template("index.html", error=error), 503, {"Retry-After": str(e.retry_after)}
 
-    # Create job ID and start background thread
-    Thread(target=process_article, args=(job_id, raw_text)).start()
+    if not is_new:
+        return redirect(url_for("result", job_id=job_id))
 
     # Redirect user to a waiting page
     return render_template("loading.html", job_id=job_id)
 
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    error = f"File is too large. Please upload files under {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."
+    return render_template("index.html", error=error), 413
+
+
 @app.route("/result/<job_id>")
 def result(job_id):
-    path = os.path.join(RESULTS_DIR, f"{job_id}.json")
-    if not os.path.exists(path):
+    data = results_store.load_result(job_id)
+    if data is None:
         return render_template("loading.html", job_id=job_id)
 
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
     if "error" in data:
         return render_template("index.html", error=data["error"])
 
     return render_template('result.html', **data)
 
+def get_job_status(job_id):
+    """Progress of a job as reported to the loading page, or None for an unknown job."""
+    if results_store.has_result(job_id):
+        return {"done": True, "step": "Analysis Complete"}
+    return job_store.get_job(job_id)
+
 @app.route("/status/<job_id>")
 def check_status_update(job_id):
-    path = os.path.join(RESULTS_DIR, f"{job_id}.json")
-    if os.path.exists(path):
-        return jsonify({"done": True, "step": "Analysis Complete"})
-    else:
-        return jsonify(task_status[job_id])
+    status = get_job_status(job_id)
+    if status is None:
+        return jsonify({"error": "Unknown job."}), 404
+    return jsonify(status)
+
+SSE_POLL_INTERVAL = 0.5  # seconds between checks of the shared job store
+SSE_MAX_DURATION = 30  # close the stream periodically; EventSource reconnects on its own
+# Each open stream holds a gunicorn thread; past this many per worker, pages poll /status instead
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", 4))
+sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+@app.route("/events/<job_id>")
+def job_events(job_id):
+    """Server-Sent Events stream that pushes a job's progress whenever it changes."""
+    if get_job_status(job_id) is None:
+        return jsonify({"error": "Unknown job."}), 404
+    if not sse_slots.acquire(blocking=False):
+        # EventSource gives up on an error status and loading.html falls back to polling
+        return jsonify({"error": "Too many open streams."}), 503
+
+    def stream():
+        yield "retry: 1000\n\n"
+        last = None
+        last_sent = started = time.time()
+        while time.time() - started < SSE_MAX_DURATION:
+            status = get_job_status(job_id)
+            if status != last:
+                last = status
+                last_sent = time.time()
+                yield f"data: {json.dumps(status)}\n\n"
+                if status is None or status.get("done"):
+                    return
+            elif time.time() - last_sent > 15:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            time.sleep(SSE_POLL_INTERVAL)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(stream_with_context(stream()), mimetype="text/event-stream", headers=headers)
+    # Called when the server is done with the response, even if the stream never started
+    response.call_on_close(sse_slots.release)
+    return response
+
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 200))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", JOB_WORKERS))  # jobs all batches may have queued or running, per worker
+BATCH_TIMEOUT = int(os.getenv("BATCH_TIMEOUT", 60 * 60))  # seconds before the remaining items are reported as timed out
+BATCH_POLL_INTERVAL = 0.5
+# Each open batch holds a gunicorn thread for up to BATCH_TIMEOUT; past this many per worker, batches get 503
+BATCH_MAX_STREAMS = int(os.getenv("BATCH_MAX_STREAMS", 2))
+batch_streams = threading.BoundedSemaphore(BATCH_MAX_STREAMS)
+# Scrapes URLs for all batches ahead of their turn in the job queue
+scrape_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("BATCH_SCRAPE_WORKERS", 8)), thread_name_prefix="scrape"
+)
+# Shared by every batch in this worker, so concurrent batches don't each get BATCH_CONCURRENCY jobs
+batch_slots = threading.BoundedSemaphore(BATCH_CONCURRENCY)
+
+def batch_item_text(item):
+    """Returns (raw_text, job_id) for a batch item; job_id is set when the URL is being pre-analyzed."""
+    if item.get("text"):
+        return item["text"].strip(), None
+    known_job_id = analysis_cache.find_preanalysis(item["url"])
+    if known_job_id:
+        return None, known_job_id
+    with tracing.span("scrape"):
+        return scrape_with_newspaper_or_fallback(item["url"].strip()), None
+
+def run_batch(items):
+    """
+    Yields one NDJSON line per item as its analysis finishes. All batches in this worker together
+    keep at most BATCH_CONCURRENCY jobs in the shared queue, so interactive submissions wait
+    behind no more than that many batch jobs. The stream holds a gunicorn thread for as long
+    as the batch runs (up to BATCH_TIMEOUT), checking for results every BATCH_POLL_INTERVAL.
+    """
+    def line(i, **fields):
+        return json.dumps({"index": i, "id": items[i].get("id"), **fields}) + "\n"
+
+    def free_slot(i):
+        if i in slotted:
+            slotted.discard(i)
+            batch_slots.release()
+
+    prepared = [scrape_executor.submit(batch_item_text, item) for item in items]
+    waiting = list(range(len(items)))
+    running = {}  # item index -> job_id
+    slotted = set()  # items whose job holds one of the batch_slots
+    deadline = time.time() + BATCH_TIMEOUT
+    retry_at = 0
+
+    try:
+        while (waiting or running) and time.time() < deadline:
+            for i in list(waiting):
+                if not prepared[i].done():
+                    continue
+                try:
+                    raw_text, job_id = prepared[i].result()
+                    if job_id is None and raw_text:
+                        # Only new analyses take one of the shared slots
+                        if time.time() < retry_at or not batch_slots.acquire(blocking=False):
+                            continue
+                        slotted.add(i)
+                        job_id = start_analysis(raw_text, url=items[i].get("url"))[0]
+                except QueueFullError as e:
+                    retry_at = time.time() + min(e.retry_after, 5)
+                    free_slot(i)
+                    continue
+                except Exception as e:
+                    print("Batch item failed:", e)
+                    free_slot(i)
+                    waiting.remove(i)
+                    yield line(i, error=f"The item could not be analyzed: {e}")
+                    continue
+                waiting.remove(i)
+                if job_id:
+                    running[i] = job_id
+                else:
+                    yield line(i, error="Failed to extract article from URL.")
+
+            for i, job_id in list(running.items()):
+                data = results_store.load_result(job_id)
+                if data is None:
+                    continue
+                del running[i]
+                free_slot(i)
+                if "error" in data:
+                    yield line(i, job_id=job_id, error=data["error"])
+                else:
+                    yield line(i, job_id=job_id, result=data)
+
+            if waiting or running:
+                time.sleep(BATCH_POLL_INTERVAL)
+
+        for i in waiting:
+            yield line(i, error="The batch timed out before this item was analyzed.")
+        for i, job_id in running.items():
+            yield line(i, job_id=job_id, error="The batch timed out before this item was analyzed.")
+    finally:
+        # Also reached when the client disconnects mid-stream: stop scraping for it and free its slots
+        for future in prepared:
+            future.cancel()
+        for i in list(slotted):
+            free_slot(i)
+
+@app.route("/api/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """
+    Takes {"items": [{"url": ...} or {"text": ..., "id": optional}]} and streams back one
+    JSON line per item, in completion order, with the analysis result or an error.
+    """
+    payload = request.get_json(silent=True)
+    items = payload.get("items") if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a JSON list of items."}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items per batch."}), 400
+    for item in items:
+        if not isinstance(item, dict) or not (
+            isinstance(item.get("text"), str) and item["text"].strip()
+            or isinstance(item.get("url"), str) and item["url"].strip()
+        ):
+            return jsonify({"error": "Each item needs a non-empty \"url\" or \"text\"."}), 400
+    if not batch_streams.acquire(blocking=False):
+        return jsonify({"error": "Too many batches are running. Please try again later."}), 503, {"Retry-After": "60"}
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(stream_with_context(run_batch(items)), mimetype="application/x-ndjson", headers=headers)
+    response.call_on_close(batch_streams.release)
+    return response
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Stage timings, token usage, cost and search counts, plus queue/thread/memory gauges, for all workers."""
+    metrics.publish_gauges(scheduler.stats(), tracing.rss_bytes())
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,103 @@
+"""
+Micro-benchmark for apply_combined_highlights on long articles with many spans.
+
+    python benchmarks/bench_highlights.py [--words 20000] [--spans 300]
+
+Compares the offset-based engine in highlights.py with the previous
+find/replace implementation (kept below for reference) and reports how many
+spans each one managed to highlight.
+"""
+import argparse
+import html
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from highlights import apply_combined_highlights  # noqa: E402
+
+WORDS = ("officials", "said", "the", "policy", "would", "reckless", "critics", "argue", "data", "shows",
+         "growth", "of", "percent", "in", "report", "according", "to", "experts", "disaster", "claim")
+
+
+def legacy_highlights(text, bias_passages, misinfo_claims):
+    """The original str.find / str.replace implementation."""
+    spans = []
+    for b in bias_passages:
+        passage = b["passage"].strip()
+        if passage in text:
+            spans.append({"type": "bias", "passage": passage, "reason": b["reasoning"].strip()})
+    for m in misinfo_claims:
+        claim = m["original-passage"].strip()
+        if claim in text:
+            spans.append({"type": "misinfo", "passage": claim, "verdict": m["verdict"].strip(),
+                          "reason": f"{m['verdict']}: {m['justification']}", "source": m.get("source", "").strip()})
+    spans = sorted(spans, key=lambda span: text.find(span["passage"]))
+    modified = set()
+    for span in spans:
+        passage = span["passage"]
+        if passage in modified:
+            continue
+        reason = html.escape(span["reason"])
+        escaped_passage = html.escape(passage)
+        if span["type"] == "bias":
+            tag = f'<span class="highlight bias" data-reason="{reason}">{escaped_passage}</span>'
+        else:
+            tag = f'<span class="highlight misinfo {span["verdict"].lower()}" data-reason="{reason}">{escaped_passage}</span>'
+        text = text.replace(passage, tag, 1)
+        modified.add(passage)
+    return text
+
+
+def make_article(n_words, n_spans, rng):
+    words = [rng.choice(WORDS) for _ in range(n_words)]
+    # Sentence-ish punctuation and smart quotes, like scraped articles have
+    for i in range(0, n_words, 12):
+        words[i] = words[i] + "."
+    for i in range(5, n_words, 40):
+        words[i] = "“" + words[i] + "”"
+    text = " ".join(words)
+
+    bias, misinfo = [], []
+    for k in range(n_spans):
+        start = rng.randrange(0, n_words - 10)
+        passage = " ".join(words[start:start + rng.randint(4, 10)])
+        # Roughly a third of the quotes come back with straight quotes / extra spaces
+        if k % 3 == 0:
+            passage = passage.replace("“", '"').replace("”", '"').replace(" ", "  ", 1)
+        if k % 2:
+            bias.append({"passage": passage, "reasoning": "Language Bias – loaded wording."})
+        else:
+            misinfo.append({"original-passage": passage, "verdict": "Unverified",
+                            "justification": "No source found.", "source": "No relevant source found"})
+    return text, bias, misinfo
+
+
+def timed(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--words", type=int, default=20000)
+    parser.add_argument("--spans", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    text, bias, misinfo = make_article(args.words, args.spans, random.Random(args.seed))
+    print(f"Article: {len(text):,} chars, {args.words:,} words, {args.spans} spans")
+    for name, func in (("legacy", legacy_highlights), ("offsets", apply_combined_highlights)):
+        seconds, output = timed(func, text, bias, misinfo)
+        highlighted = output.count('class="highlight')
+        print(f"{name:>8}: {seconds * 1000:8.1f} ms  {highlighted:4d} spans highlighted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Offline load test: runs NewsSense under the Procfile's gunicorn command against local stand-ins.
+
+    python benchmarks/load_test.py [--clients 20] [--duration 60] [--output report.json] [--baseline old.json]
+
+Each simulated user loads /, submits an article to /analyze (pasted text, or a URL served by
+the stand-ins), polls /status until the job is done and fetches /result. The report has
+throughput, p50/p95/p99 latency per endpoint, and the peak thread count and RSS of the
+gunicorn process tree. With --baseline the run fails (exit code 1) when throughput drops,
+p95 latency or peak RSS grows by more than --tolerance, or too many requests fail.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import psutil
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_services  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOB_ID_RE = re.compile(r"/status/([0-9a-f-]{36})")
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = 0
+        self.jobs = []
+
+    def add(self, name, seconds, ok=True):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def gunicorn_command(port, extra_args):
+    with open(os.path.join(ROOT, "Procfile"), "r") as file:
+        command = file.read().strip()
+    if command.startswith("web:"):
+        command = command[len("web:"):]
+    args = shlex.split(command)
+    # Same options as production, but from this interpreter and on a local port
+    return [sys.executable, "-m", *args, *shlex.split(extra_args), "--bind", f"127.0.0.1:{port}"]
+
+
+def start_app(port, stub_port, extra_args, env_overrides, db_dir):
+    stub = f"http://127.0.0.1:{stub_port}"
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"{stub}/v1",
+        "GOOGLE_SEARCH_API_KEY": "stub",
+        "GOOGLE_CSE_ID": "stub",
+        "SEARCH_URL": f"{stub}/customsearch/v1",
+        "NEWS_API_KEY": "stub",
+        "NEWS_API_URL": f"{stub}/api/1/latest",
+        "NEWSSENSE_DB": os.path.join(db_dir, "newssense.db"),
+        "MISINFO_MODE": "parallel",
+        **env_overrides,
+    }
+    process = subprocess.Popen(gunicorn_command(port, extra_args), cwd=ROOT, env=env)
+    base = f"http://127.0.0.1:{port}"
+    started = time.time()
+    while time.time() - started < 60:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with code {process.returncode}")
+        try:
+            requests.get(base + "/", timeout=2)
+            return process, base
+        except requests.exceptions.RequestException:
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("gunicorn did not start within 60 seconds")
+
+
+def sample_resources(pid, stop, peaks):
+    while not stop.is_set():
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+            rss = sum(p.memory_info().rss for p in processes)
+            threads = sum(p.num_threads() for p in processes)
+            peaks["rss_mb"] = max(peaks.get("rss_mb", 0), rss / 1024 ** 2)
+            peaks["threads"] = max(peaks.get("threads", 0), threads)
+        except psutil.Error:
+            pass
+        stop.wait(0.5)
+
+
+def timed_request(recorder, name, call, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = call(*args, **kwargs)
+    except requests.exceptions.RequestException:
+        recorder.add(name, time.perf_counter() - start, ok=False)
+        return None
+    recorder.add(name, time.perf_counter() - start, ok=response.status_code < 500 or response.status_code == 503)
+    return response
+
+
+def run_client(base, stub, args, recorder, deadline, seeds, rng):
+    session = requests.Session()
+    while time.time() < deadline:
+        timed_request(recorder, "/", session.get, base + "/", timeout=30)
+
+        if seeds and rng.random() < args.repeat_ratio:
+            seed = rng.choice(seeds)
+        else:
+            seed = rng.getrandbits(48)
+            seeds.append(seed)
+        if rng.random() < args.url_ratio:
+            form = {"article_url": f"{stub}/article/{seed}"}
+        else:
+            form = {"article_text": stub_services.make_article(seed, args.words)}
+
+        job_started = time.perf_counter()
+        response = timed_request(recorder, "/analyze", session.post, base + "/analyze", data=form,
+                                 allow_redirects=False, timeout=60)
+        if response is None:
+            continue
+        if response.status_code == 503:
+            with recorder.lock:
+                recorder.rejected += 1
+            time.sleep(min(int(response.headers.get("Retry-After", 5)), 10))
+            continue
+        if response.status_code in (301, 302, 303):
+            job_id = response.headers["Location"].rstrip("/").split("/")[-1]
+        else:
+            match = JOB_ID_RE.search(response.text)
+            if not match:
+                continue
+            job_id = match.group(1)
+            while time.time() < deadline + args.job_timeout:
+                status = timed_request(recorder, "/status", session.get, f"{base}/status/{job_id}", timeout=30)
+                if status is not None and status.status_code == 200 and status.json().get("done"):
+                    break
+                time.sleep(args.poll_interval)
+
+        result = timed_request(recorder, "/result", session.get, f"{base}/result/{job_id}", timeout=30)
+        if result is not None and result.status_code == 200:
+            with recorder.lock:
+                recorder.jobs.append(time.perf_counter() - job_started)
+
+
+def build_report(recorder, elapsed, peaks, args):
+    endpoints = {}
+    for name, values in sorted(recorder.latencies.items()):
+        endpoints[name] = {
+            "count": len(values),
+            "errors": recorder.errors[name],
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+        }
+    requests_total = sum(len(v) for v in recorder.latencies.values())
+    return {
+        "clients": args.clients,
+        "duration_s": round(elapsed, 1),
+        "requests_per_second": round(requests_total / elapsed, 2),
+        "jobs_completed": len(recorder.jobs),
+        "jobs_per_second": round(len(recorder.jobs) / elapsed, 3),
+        "job_p50_ms": round((percentile(recorder.jobs, 50) or 0) * 1000, 1),
+        "job_p95_ms": round((percentile(recorder.jobs, 95) or 0) * 1000, 1),
+        "job_p99_ms": round((percentile(recorder.jobs, 99) or 0) * 1000, 1),
+        "rejected": recorder.rejected,
+        "error_rate": round(sum(recorder.errors.values()) / max(requests_total, 1), 4),
+        "peak_rss_mb": round(peaks.get("rss_mb", 0), 1),
+        "peak_threads": peaks.get("threads", 0),
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report):
+    print(f"\n{report['clients']} clients for {report['duration_s']}s: "
+          f"{report['requests_per_second']} req/s, {report['jobs_completed']} jobs "
+          f"({report['jobs_per_second']}/s), {report['rejected']} rejected with 503")
+    print(f"job latency p50/p95/p99: {report['job_p50_ms']} / {report['job_p95_ms']} / {report['job_p99_ms']} ms")
+    print(f"peak RSS {report['peak_rss_mb']} MB, peak threads {report['peak_threads']}, "
+          f"error rate {report['error_rate']:.2%}\n")
+    print(f"{'endpoint':<10} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in report["endpoints"].items():
+        print(f"{name:<10} {stats['count']:>7} {stats['errors']:>7} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+
+
+def regressions(report, baseline, tolerance, max_error_rate):
+    failures = []
+    if report["error_rate"] > max_error_rate:
+        failures.append(f"error rate {report['error_rate']:.2%} is above {max_error_rate:.2%}")
+    if baseline is None:
+        return failures
+    if report["jobs_per_second"] < baseline["jobs_per_second"] * (1 - tolerance):
+        failures.append(f"throughput fell from {baseline['jobs_per_second']} to {report['jobs_per_second']} jobs/s")
+    for key in ("job_p95_ms", "peak_rss_mb"):
+        if baseline.get(key) and report[key] > baseline[key] * (1 + tolerance):
+            failures.append(f"{key} grew from {baseline[key]} to {report[key]}")
+    for name, stats in report["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(name)
+        if old and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name} p95 grew from {old['p95_ms']} to {stats['p95_ms']} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load")
+    parser.add_argument("--words", type=int, default=600, help="words per generated article")
+    parser.add_argument("--url-ratio", type=float, default=0.3, help="share of submissions made by URL")
+    parser.add_argument("--repeat-ratio", type=float, default=0.2, help="share of re-submitted articles")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--job-timeout", type=float, default=240, help="seconds to wait for jobs after the run")
+    parser.add_argument("--gunicorn-args", default="", help='extra options, e.g. "--workers 4 --threads 8"')
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. ANALYSIS_MODE=fused")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="earlier --output report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    stub_services.add_arguments(parser)
+    args = parser.parse_args()
+
+    stub_services.configure(args)
+    stub = stub_services.start()
+    stub_url = f"http://127.0.0.1:{stub.server_port}"
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        process, base = start_app(free_port(), stub.server_port, args.gunicorn_args, env_overrides, db_dir)
+        stop, peaks = threading.Event(), {}
+        sampler = threading.Thread(target=sample_resources, args=(process.pid, stop, peaks), daemon=True)
+        sampler.start()
+        try:
+            recorder, seeds = Recorder(), []
+            deadline = time.time() + args.duration
+            started = time.time()
+            clients = [
+                threading.Thread(target=run_client,
+                                 args=(base, stub_url, args, recorder, deadline, seeds, random.Random(args.seed + i)))
+                for i in range(args.clients)
+            ]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.time() - started
+        finally:
+            stop.set()
+            sampler.join()
+            process.terminate()
+            process.wait(30)
+
+    report = build_report(recorder, elapsed, peaks, args)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+    failures = regressions(report, baseline, args.tolerance, args.max_error_rate)
+    for failure in failures:
+        print("REGRESSION:", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Local stand-ins for OpenAI chat completions, Google Custom Search, newsdata.io and article pages.
+
+    python benchmarks/stub_services.py [--port 8900] [--llm-latency 0.5] [--error-rate 0.02]
+
+Point NewsSense at it with OPENAI_BASE_URL=http://127.0.0.1:8900/v1,
+SEARCH_URL=http://127.0.0.1:8900/customsearch/v1 and NEWS_API_URL=http://127.0.0.1:8900/api/1/latest.
+Chat responses are picked by matching the system prompt against prompts/*.txt, so every
+pipeline mode gets well-formed output. The agno agent (MISINFO_MODE=agent) needs tool calls
+and is not supported; use MISINFO_MODE=parallel.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts")
+WORDS = ("officials", "said", "the", "policy", "would", "reckless", "critics", "argue", "data", "shows",
+         "growth", "of", "percent", "in", "report", "according", "to", "experts", "disaster", "claim")
+
+
+class Settings:
+    llm_latency = 0.5  # seconds before the first token
+    token_latency = 0.002  # seconds per output token
+    search_latency = 0.1
+    news_latency = 0.1
+    page_latency = 0.05
+    error_rate = 0.0  # share of LLM and search requests answered with 429 / 500
+
+
+def make_article(seed, n_words=600):
+    rng = random.Random(seed)
+    sentences = []
+    while sum(len(s.split()) for s in sentences) < n_words:
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    paragraphs = [" ".join(sentences[i:i + 4]) for i in range(0, len(sentences), 4)]
+    return "\n\n".join(paragraphs)
+
+
+def _sentences(article):
+    return [s.strip() for s in re.split(r"(?<=\.)\s+", article) if len(s.split()) >= 6]
+
+
+def _article_from(message):
+    # User messages are "<instruction>:\n\n<article>"
+    return message.split("\n\n", 1)[-1]
+
+
+def _passages(article, count, seed):
+    sentences = _sentences(article)
+    rng = random.Random(seed)
+    return [" ".join(s.split()[:6]) for s in rng.sample(sentences, min(count, len(sentences)))]
+
+
+def _bias(article, seed):
+    return {
+        "bias_score": 2.5,
+        "highlighted_passages": [
+            {"passage": p, "reasoning": "Language Bias – loaded wording."} for p in _passages(article, 3, seed)
+        ],
+        "rubric_justification": {
+            "language_bias": 1, "framing_bias": 1, "sourcing_bias": 0.5, "overall_reasoning": "Some loaded terms."
+        },
+    }
+
+
+def _claims(article, seed):
+    return [
+        {"claim-query": p + " report", "original-passage": p} for p in _passages(article, 3, seed + 1)
+    ]
+
+
+def respond(prompt_name, user_message):
+    """Returns the assistant text for a chat call made with the given system prompt file."""
+    article = _article_from(user_message)
+    seed = int(hashlib.sha256(article.encode("utf-8")).hexdigest()[:8], 16)
+    if prompt_name == "summary_message.txt":
+        return " ".join(_sentences(article)[:3]) or "Summary."
+    if prompt_name == "bias_message.txt":
+        return json.dumps(_bias(article, seed))
+    if prompt_name == "unbias_message.txt":
+        return article.split("Article:\n", 1)[-1]
+    if prompt_name == "unbias_edits_message.txt":
+        ids = re.findall(r"^(\d+)\. Passage:", user_message, re.M)
+        return json.dumps({"edits": [{"id": int(i), "replacement": "neutral wording"} for i in ids]})
+    if prompt_name == "claim_extraction_message.txt":
+        return json.dumps({"claims": _claims(article, seed)})
+    if prompt_name == "claim_verdict_message.txt":
+        return json.dumps({"verdict": "Supported", "justification": "Stub source agrees.",
+                           "source": "http://127.0.0.1/source"})
+    if prompt_name == "fused_message.txt":
+        return json.dumps({**_bias(article, seed), "summary": " ".join(_sentences(article)[:3]),
+                           "claims": _claims(article, seed)})
+    return "OK"
+
+
+def load_prompts():
+    prompts = {}
+    for name in os.listdir(PROMPTS_DIR):
+        with open(os.path.join(PROMPTS_DIR, name), "r") as file:
+            prompts[file.read()] = name
+    return prompts
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    prompts = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _maybe_fail(self):
+        if random.random() >= Settings.error_rate:
+            return False
+        if random.random() < 0.5:
+            self._send(429, json.dumps({"error": {"message": "Rate limited (stub)", "type": "rate_limit"}}),
+                       headers={"Retry-After": "1"})
+        else:
+            self._send(500, json.dumps({"error": {"message": "Server error (stub)", "type": "server_error"}}))
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/customsearch/v1":
+            time.sleep(Settings.search_latency)
+            if self._maybe_fail():
+                return
+            query = parse_qs(url.query).get("q", [""])[0]
+            items = [{"title": f"Result {i} for {query[:40]}", "link": f"http://127.0.0.1/source/{i}",
+                      "snippet": query} for i in range(5)]
+            self._send(200, json.dumps({"items": items}))
+        elif url.path == "/api/1/latest":
+            time.sleep(Settings.news_latency)
+            results = [{"title": f"Headline {i}", "source_name": "Stub News", "link": f"http://127.0.0.1/article/{i}",
+                        "image_url": "http://127.0.0.1/image.png"} for i in range(10)]
+            self._send(200, json.dumps({"results": results}))
+        elif url.path.startswith("/article/"):
+            time.sleep(Settings.page_latency)
+            article = make_article(url.path)
+            etag = '"' + hashlib.sha256(article.encode("utf-8")).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, b"", headers={"ETag": etag})
+                return
+            body = "<html><body>" + "".join(f"<p>{p}</p>" for p in article.split("\n\n")) + "</body></html>"
+            self._send(200, body, "text/html; charset=utf-8", {"ETag": etag})
+        else:
+            self._send(404, json.dumps({"error": "not found"}))
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/v1/chat/completions":
+            self._send(404, json.dumps({"error": "not found"}))
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(Settings.llm_latency)
+        if self._maybe_fail():
+            return
+
+        messages = request.get("messages", [])
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        content = respond(self.prompts.get(system), user)
+        tokens = max(1, len(content) // 4)
+        usage = {"prompt_tokens": sum(len(m["content"]) for m in messages) // 4,
+                 "completion_tokens": tokens}
+        usage["total_tokens"] = usage["prompt_tokens"] + tokens
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": request.get("model", "stub")}
+
+        if not request.get("stream"):
+            time.sleep(tokens * Settings.token_latency)
+            self._send(200, json.dumps({
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+            }))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        pieces = re.findall(r"\S+\s*", content) or [content]
+        for piece in pieces:
+            time.sleep(max(1, len(piece) // 4) * Settings.token_latency)
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        done = {**base, "object": "chat.completion.chunk", "usage": usage,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.close_connection = True
+
+
+def start(port=0):
+    """Starts the stand-ins on a background thread and returns the server (server.server_port)."""
+    Handler.prompts = load_prompts()
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-services", daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument("--llm-latency", type=float, default=Settings.llm_latency)
+    parser.add_argument("--token-latency", type=float, default=Settings.token_latency)
+    parser.add_argument("--search-latency", type=float, default=Settings.search_latency)
+    parser.add_argument("--error-rate", type=float, default=Settings.error_rate)
+
+
+def configure(args):
+    Settings.llm_latency = args.llm_latency
+    Settings.token_latency = args.token_latency
+    Settings.search_latency = args.search_latency
+    Settings.error_rate = args.error_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure(args)
+    server = start(args.port)
+    print(f"Stand-in services listening on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
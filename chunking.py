@@ -0,0 +1,98 @@
+import re
+
+from highlights import normalize_passage
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except ImportError:  # tiktoken is optional; fall back to the usual ~4 characters per token
+    _encoding = None
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def split_into_chunks(text, max_tokens):
+    """
+    Splits text into chunks of at most ~max_tokens, breaking on paragraph boundaries.
+    Paragraphs that are too long on their own are split by sentence, then by word.
+    """
+    pieces = []
+    for paragraph in _PARAGRAPH_BREAK.split(text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+            else:
+                pieces.extend(_pack(sentence.split(" "), max_tokens, " "))
+    return _pack(pieces, max_tokens, "\n\n")
+
+
+def _pack(pieces, max_tokens, separator):
+    """Greedily joins consecutive pieces while they fit in max_tokens."""
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def merge_bias_results(results, weights):
+    """
+    Reconciles per-chunk determine_bias outputs into one: scores and rubric categories are
+    averaged weighted by chunk size, passages are deduplicated, and the overall reasoning
+    comes from the most biased chunk.
+    """
+    total = sum(weights) or 1
+
+    def weighted(values):
+        return round(sum(v * w for v, w in zip(values, weights)) / total, 1)
+
+    passages, seen = [], set()
+    for result in results:
+        for passage in result.get("highlighted_passages", []):
+            key = normalize_passage(passage["passage"])
+            if key not in seen:
+                seen.add(key)
+                passages.append(passage)
+
+    rubrics = [result.get("rubric_justification", {}) for result in results]
+    most_biased = max(range(len(results)), key=lambda i: results[i].get("bias_score", 0))
+    return {
+        "bias_score": weighted([r.get("bias_score", 0) for r in results]),
+        "highlighted_passages": passages,
+        "rubric_justification": {
+            "language_bias": weighted([r.get("language_bias", 0) for r in rubrics]),
+            "framing_bias": weighted([r.get("framing_bias", 0) for r in rubrics]),
+            "sourcing_bias": weighted([r.get("sourcing_bias", 0) for r in rubrics]),
+            "overall_reasoning": rubrics[most_biased].get("overall_reasoning", ""),
+        },
+    }
+
+
+def dedupe_claims(claims):
+    """Drops claims whose original passage was already reported by another chunk."""
+    unique, seen = [], set()
+    for claim in claims:
+        key = normalize_passage(claim["original-passage"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(claim)
+    return unique
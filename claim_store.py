@@ -0,0 +1,147 @@
+import hashlib
+import os
+import random
+import re
+import struct
+import time
+import unicodedata
+
+from storage import ensure_schema, get_db, transaction
+
+# Verdicts from earlier articles, so a claim repeated across the news cycle (a quoted statistic,
+# an official's statement) is searched and judged once. Lookups match the normalized claim text
+# exactly, then near-duplicates through MinHash signatures bucketed with LSH.
+CLAIM_KB_TTL = int(os.getenv("CLAIM_KB_TTL", 3 * 24 * 60 * 60))  # verdicts older than this are re-checked
+CLAIM_MATCH_THRESHOLD = float(os.getenv("CLAIM_MATCH_THRESHOLD", 0.8))  # Jaccard similarity of shingles
+SHINGLE_SIZE = 5  # characters
+BANDS, ROWS = 16, 4  # 64 MinHash values; finds most pairs with similarity above ~0.5 for the exact check
+EVICT_PROBABILITY = 0.01
+# A claim and its denial are near-duplicates by shingles, so matches must negate the same way
+NEGATIONS = {"not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "without", "cannot",
+             "deny", "denies", "denied", "false", "untrue"}
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1)  # fixed seed: signatures must be comparable across processes and restarts
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(BANDS * ROWS)]
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS claim_verdicts (
+    claim_key     TEXT PRIMARY KEY,     -- normalized claim text
+    claim_query   TEXT NOT NULL,
+    verdict       TEXT NOT NULL,
+    justification TEXT NOT NULL,
+    source        TEXT NOT NULL,
+    created_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS claim_verdicts_created_at ON claim_verdicts (created_at);
+CREATE TABLE IF NOT EXISTS claim_lsh (
+    band      INTEGER NOT NULL,
+    bucket    INTEGER NOT NULL,         -- hash of the band's MinHash values
+    claim_key TEXT NOT NULL,
+    PRIMARY KEY (band, bucket, claim_key)
+);
+CREATE INDEX IF NOT EXISTS claim_lsh_claim_key ON claim_lsh (claim_key);
+""")
+
+
+def normalize_claim(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"[^\w%.]+", " ", text)
+    return re.sub(r"\s+", " ", text.replace(". ", " ")).strip(" .")
+
+
+def _numbers(normalized):
+    return set(re.findall(r"\d+(?:\.\d+)?", normalized))
+
+
+def _negations(normalized):
+    found = {word for word in normalized.split() if word in NEGATIONS}
+    if re.search(r"\wn t\b", normalized):  # contractions: "didn't" is normalized to "didn t"
+        found.add("not")
+    return found
+
+
+def _shingles(normalized):
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def _bucket_ids(shingles):
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles
+    ]
+    signature = [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+    buckets = []
+    for band in range(BANDS):
+        values = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f">{ROWS}Q", *values), digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, "big") >> 1))  # fits SQLite's signed 64-bit integers
+    return buckets
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def lookup(claim_query):
+    """
+    Returns the stored {"verdict", "justification", "source"} for this claim or a near-duplicate
+    of it, or None. Near-duplicates must mention exactly the same numbers and negations.
+    """
+    key = normalize_claim(claim_query)
+    conn = get_db()
+    cutoff = time.time() - CLAIM_KB_TTL
+    row = conn.execute(
+        "SELECT verdict, justification, source FROM claim_verdicts WHERE claim_key = ? AND created_at > ?",
+        (key, cutoff),
+    ).fetchone()
+    if row:
+        return dict(row)
+
+    shingles = _shingles(key)
+    buckets = _bucket_ids(shingles)
+    candidates = conn.execute(
+        "SELECT DISTINCT v.claim_key, v.verdict, v.justification, v.source FROM claim_lsh l "
+        "JOIN claim_verdicts v ON v.claim_key = l.claim_key "
+        f"WHERE v.created_at > ? AND ({' OR '.join(['(l.band = ? AND l.bucket = ?)'] * len(buckets))})",
+        (cutoff, *[value for bucket in buckets for value in bucket]),
+    ).fetchall()
+
+    best, best_score = None, CLAIM_MATCH_THRESHOLD
+    for candidate in candidates:
+        if _numbers(candidate["claim_key"]) != _numbers(key) or _negations(candidate["claim_key"]) != _negations(key):
+            continue
+        score = _jaccard(shingles, _shingles(candidate["claim_key"]))
+        if score >= best_score:
+            best, best_score = candidate, score
+    if best is None:
+        return None
+    return {"verdict": best["verdict"], "justification": best["justification"], "source": best["source"]}
+
+
+def remember(claim_query, verdict, justification, source):
+    """Stores a checked claim's verdict for later articles."""
+    key = normalize_claim(claim_query)
+    now = time.time()
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO claim_verdicts (claim_key, claim_query, verdict, justification, source, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, claim_query, verdict, justification, source, now),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO claim_lsh (band, bucket, claim_key) VALUES (?, ?, ?)",
+            [(band, bucket, key) for band, bucket in _bucket_ids(_shingles(key))],
+        )
+        if random.random() < EVICT_PROBABILITY:
+            _evict(conn, now)
+
+
+def _evict(conn, now):
+    cutoff = now - CLAIM_KB_TTL
+    conn.execute(
+        "DELETE FROM claim_lsh WHERE claim_key IN (SELECT claim_key FROM claim_verdicts WHERE created_at < ?)",
+        (cutoff,),
+    )
+    conn.execute("DELETE FROM claim_verdicts WHERE created_at < ?", (cutoff,))
@@ -0,0 +1,121 @@
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import threading
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", 10)) * 1024 * 1024
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", 100))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", 2))
+EXTRACT_TIMEOUT = 60  # seconds
+
+
+class ExtractionError(Exception):
+    """Raised when an uploaded document can't be turned into text."""
+
+
+# Each extractor takes the raw file bytes and yields text a piece (page/paragraph) at a time,
+# so extraction can stop as soon as enough words have been read.
+
+def iter_txt(data):
+    for paragraph in data.decode("utf-8", errors="replace").split("\n\n"):
+        yield paragraph
+
+
+def iter_pdf(data):
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    for i, page in enumerate(reader.pages):
+        if i >= MAX_PDF_PAGES:
+            break
+        yield page.extract_text() or ""
+
+
+def iter_docx(data):
+    from docx import Document
+
+    for para in Document(io.BytesIO(data)).paragraphs:
+        yield para.text
+
+
+def iter_html(data):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(data, "html.parser")
+    for p in soup.find_all("p"):
+        yield p.get_text()
+
+
+EXTRACTORS = {
+    ".txt": iter_txt,
+    ".pdf": iter_pdf,
+    ".docx": iter_docx,
+    ".html": iter_html,
+    ".htm": iter_html,
+}
+
+# Cheap enough to run on the request thread; everything else goes to the process pool
+INLINE_EXTRACTORS = {".txt"}
+
+
+def extension(filename):
+    return os.path.splitext(filename.lower())[1]
+
+
+def is_supported(filename):
+    return extension(filename) in EXTRACTORS
+
+
+def extract_text(data, filename, max_words):
+    """Reads pieces from the file until max_words words have been collected."""
+    pieces, words = [], 0
+    for piece in EXTRACTORS[extension(filename)](data):
+        if not piece.strip():
+            continue
+        piece_words = piece.split()
+        if words + len(piece_words) >= max_words:
+            pieces.append(" ".join(piece_words[:max_words - words]))
+            break
+        pieces.append(piece.strip())
+        words += len(piece_words)
+    return "\n\n".join(pieces)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the web worker has running threads (and their locks)
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=50,
+            )
+        return _pool
+
+
+def extract_upload(data, filename, max_words):
+    """
+    Extracts text from an uploaded file. CPU-heavy formats are parsed in a separate
+    process so they don't hold this worker's GIL or inflate its memory.
+    """
+    if not is_supported(filename):
+        raise ExtractionError("Unsupported file type.")
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ExtractionError(f"File is too large. Please upload files under {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+
+    try:
+        if extension(filename) in INLINE_EXTRACTORS:
+            return extract_text(data, filename, max_words)
+        future = _get_pool().submit(extract_text, data, filename, max_words)
+        return future.result(timeout=EXTRACT_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        raise ExtractionError("The file took too long to read. Please try a smaller file.")
+    except Exception as e:
+        print("File extraction failed:", e)
+        raise ExtractionError("Could not read the uploaded file.")
@@ -0,0 +1,107 @@
+import os
+import random
+import time
+import zlib
+
+import requests
+from bs4 import UnicodeDammit
+from requests.adapters import HTTPAdapter
+
+from storage import ensure_schema, get_db, transaction
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0.0.0 Safari/537.36"
+FETCH_TIMEOUT = (5, 15)  # connect / read, in seconds
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_MB", 5)) * 1024 * 1024  # longer pages are cut off here
+PAGE_CACHE_MAX_AGE = int(os.getenv("PAGE_CACHE_MAX_AGE", 7 * 24 * 60 * 60))
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", 2000))
+EVICT_PROBABILITY = 0.05
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS page_cache (
+    url           TEXT PRIMARY KEY,
+    body          BLOB NOT NULL,        -- zlib-compressed response bytes
+    content_type  TEXT,
+    etag          TEXT,
+    last_modified TEXT,
+    fetched_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS page_cache_fetched_at ON page_cache (fetched_at);
+""")
+
+# One session per worker; the adapter keeps a separate connection pool for each host
+session = requests.Session()
+session.headers["User-Agent"] = USER_AGENT
+for prefix in ("https://", "http://"):
+    session.mount(prefix, HTTPAdapter(pool_connections=32, pool_maxsize=8))
+
+
+class FetchError(Exception):
+    """Raised when a page can't be downloaded."""
+
+
+def fetch_page(url):
+    """
+    Downloads `url` once and returns its HTML as text. Pages seen before are revalidated with
+    their ETag / Last-Modified, so an unchanged page is not downloaded again.
+    """
+    cached = get_db().execute(
+        "SELECT body, content_type, etag, last_modified FROM page_cache WHERE url = ? AND fetched_at > ?",
+        (url, time.time() - PAGE_CACHE_MAX_AGE),
+    ).fetchone()
+    headers = {}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        with session.get(url, headers=headers, timeout=FETCH_TIMEOUT, stream=True) as response:
+            if response.status_code == 304 and cached:
+                get_db().execute("UPDATE page_cache SET fetched_at = ? WHERE url = ?", (time.time(), url))
+                return _decode(zlib.decompress(cached["body"]), cached["content_type"])
+            response.raise_for_status()
+            body = _read_capped(response)
+            content_type = response.headers.get("Content-Type")
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+    except requests.exceptions.RequestException as e:
+        raise FetchError(str(e)) from e
+
+    if etag or last_modified:
+        _store(url, body, content_type, etag, last_modified)
+    return _decode(body, content_type)
+
+
+def _read_capped(response):
+    chunks, size = [], 0
+    for chunk in response.iter_content(64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= FETCH_MAX_BYTES:
+            print(f"[Fetch] {response.url} is larger than {FETCH_MAX_BYTES} bytes; truncating")
+            break
+    return b"".join(chunks)[:FETCH_MAX_BYTES]
+
+
+def _decode(body, content_type):
+    charset = None
+    if content_type and "charset=" in content_type:
+        charset = content_type.split("charset=")[-1].split(";")[0].strip(" \"'")
+    return UnicodeDammit(body, [charset] if charset else []).unicode_markup or ""
+
+
+def _store(url, body, content_type, etag, last_modified):
+    now = time.time()
+    with transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO page_cache (url, body, content_type, etag, last_modified, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url, zlib.compress(body, 6), content_type, etag, last_modified, now),
+        )
+        if random.random() < EVICT_PROBABILITY:
+            conn.execute("DELETE FROM page_cache WHERE fetched_at < ?", (now - PAGE_CACHE_MAX_AGE,))
+            conn.execute(
+                "DELETE FROM page_cache WHERE url NOT IN "
+                "(SELECT url FROM page_cache ORDER BY fetched_at DESC LIMIT ?)",
+                (PAGE_CACHE_MAX_ENTRIES,),
+            )
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+
+import requests
+
+from storage import ensure_schema, get_db, transaction
+
+NEWS_API_URL = os.getenv("NEWS_API_URL", "https://newsdata.io/api/1/latest")
+TRUSTED_SOURCES = "bbc.com,reuters.com,forbes.com,wsj.com"
+CACHE_DURATION = 15 * 60  # 15 minutes in seconds
+REFRESH_CHECK_INTERVAL = 60  # how often each worker checks whether the feed needs refreshing
+FETCH_TIMEOUT = (3, 10)  # connect / read, in seconds
+MAX_BACKOFF = 30 * 60
+LEASE_DURATION = 60  # only one worker fetches at a time; the lease expires if it dies mid-fetch
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS headline_feed (
+    id           INTEGER PRIMARY KEY CHECK (id = 1),
+    articles     TEXT,                  -- JSON list of the last good feed
+    fetched_at   REAL NOT NULL DEFAULT 0,
+    failures     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    lease_until  REAL NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO headline_feed (id) VALUES (1);
+""")
+
+# Called with the new article list after every successful refresh
+refresh_listeners = []
+
+
+# At most one background refresh thread per worker, however many page views find the feed stale
+_local_refresh = threading.Lock()
+
+
+def get_trusted_headlines():
+    """
+    Returns the last good feed immediately (possibly stale, [] only if there has never been one)
+    and starts a background refresh if it is out of date.
+    """
+    row = get_db().execute("SELECT articles, fetched_at FROM headline_feed WHERE id = 1").fetchone()
+    if time.time() - row["fetched_at"] >= CACHE_DURATION and _local_refresh.acquire(blocking=False):
+        threading.Thread(target=_refresh_in_background, daemon=True).start()
+    return json.loads(row["articles"]) if row["articles"] else []
+
+
+def _refresh_in_background():
+    try:
+        refresh_if_stale()
+    finally:
+        _local_refresh.release()
+
+
+def refresh_if_stale():
+    """Fetches a new feed if it is stale, unless another worker is already on it or we are backing off."""
+    now = time.time()
+    with transaction() as conn:
+        claimed = conn.execute(
+            "UPDATE headline_feed SET lease_until = ? "
+            "WHERE id = 1 AND fetched_at < ? AND next_attempt <= ? AND lease_until <= ?",
+            (now + LEASE_DURATION, now - CACHE_DURATION, now, now),
+        ).rowcount
+    if not claimed:
+        return
+
+    try:
+        articles = fetch_headlines()
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        print("NewsAPI Request Error:", e)
+        with transaction() as conn:
+            failures = conn.execute("SELECT failures FROM headline_feed WHERE id = 1").fetchone()["failures"] + 1
+            conn.execute(
+                "UPDATE headline_feed SET failures = ?, next_attempt = ?, lease_until = 0 WHERE id = 1",
+                (failures, time.time() + min(30 * 2 ** failures, MAX_BACKOFF)),
+            )
+        return
+
+    get_db().execute(
+        "UPDATE headline_feed SET articles = ?, fetched_at = ?, failures = 0, next_attempt = 0, lease_until = 0 "
+        "WHERE id = 1",
+        (json.dumps(articles), time.time()),
+    )
+    for listener in refresh_listeners:
+        try:
+            listener(articles)
+        except Exception as e:
+            print("Headline refresh listener failed:", e)
+
+
+def fetch_headlines():
+    params = {
+        "domainurl": TRUSTED_SOURCES,
+        "language": "en",
+        "country": "us",
+        "category": "top",
+        "size": 10,
+        "apikey": os.getenv("NEWS_API_KEY")
+    }
+    response = requests.get(NEWS_API_URL, params=params, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+
+    return [
+        {
+            "title": article["title"],
+            "source": article["source_name"],
+            "url": article["link"],
+            "image": article["image_url"]
+        }
+        for article in data.get("results", []) if article.get("image_url")
+    ]
+
+
+def _refresh_loop():
+    while True:
+        try:
+            refresh_if_stale()
+        except Exception as e:
+            print("Headline refresher error:", e)
+        time.sleep(REFRESH_CHECK_INTERVAL)
+
+
+_refresher_started = False
+_refresher_lock = threading.Lock()
+
+
+def start_refresher():
+    """Keeps the feed fresh in the background so page views never wait on newsdata.io."""
+    global _refresher_started
+    with _refresher_lock:
+        if not _refresher_started:
+            _refresher_started = True
+            threading.Thread(target=_refresh_loop, name="headline-refresher", daemon=True).start()
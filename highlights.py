@@ -0,0 +1,241 @@
+import bisect
+import html
+import re
+from collections import deque
+
+# Typographic variants the model tends to swap for plain ASCII (or vice versa) when quoting
+_CHAR_MAP = {
+    "“": '"', "”": '"', "„": '"', "‟": '"', "″": '"', "«": '"', "»": '"',
+    "‘": "'", "’": "'", "‚": "'", "‛": "'", "′": "'",
+    "–": "-", "—": "-", "−": "-",
+    " ": " ",
+}
+
+_WHITESPACE = re.compile(r"\s+")
+_WHITESPACE_RUN = re.compile(r"\s{2,}")  # the only runs that change length when collapsed
+# Up to this many pattern × text characters, one str.find scan per pattern (in C) beats
+# building and running the pure Python automaton; past it the automaton's single pass wins.
+_FIND_WORK_LIMIT = 200_000_000
+
+
+class _OffsetMap:
+    """Maps positions in the normalized text back to the original by the whitespace removed before them."""
+
+    def __init__(self):
+        self._positions = []  # normalized position after each collapsed run
+        self._removed = []  # total characters removed up to that point
+
+    def add_run(self, position, removed):
+        self._positions.append(position)
+        self._removed.append(removed)
+
+    def __getitem__(self, position):
+        index = bisect.bisect_right(self._positions, position) - 1
+        return position + (self._removed[index] if index >= 0 else 0)
+
+
+def normalized_view(text):
+    """
+    Returns (normalized, offsets): a lowercased copy of `text` with quotes/dashes unified and
+    whitespace runs collapsed to one space, and a map from each normalized position to the
+    index of the original character it came from.
+    """
+    lowered = _lower(_unify(text))
+    offsets = _OffsetMap()
+    removed = 0
+    for match in _WHITESPACE_RUN.finditer(lowered):
+        start, end = match.span()
+        removed += end - start - 1
+        offsets.add_run(end - removed, removed)
+    return _WHITESPACE.sub(" ", lowered), offsets
+
+
+def _unify(text):
+    # Chained str.replace skips absent characters and beats str.translate with a dict on long texts
+    for char, plain in _CHAR_MAP.items():
+        if char in text:
+            text = text.replace(char, plain)
+    return text
+
+
+def _lower(text):
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # A few characters (e.g. "İ") lowercase to several; keep those as they are
+        lowered = "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+    return lowered
+
+
+def normalize_passage(passage):
+    """Same normalization as normalized_view, without the offset map."""
+    return _WHITESPACE.sub(" ", _lower(_unify(passage.strip())))
+
+
+class PassageMatcher:
+    """Aho-Corasick automaton that finds every occurrence of many patterns in one pass."""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for c in pattern:
+                nxt = self._goto[node].get(c)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][c] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and c not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(c, 0)
+                if self._out[self._fail[child]]:
+                    self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_all(self, text):
+        """Yields (start, end, pattern_index) for every match in `text`."""
+        # Edges resolved through failure links are memoized in a per-call copy of the goto table,
+        # so a matcher shared between threads is never modified.
+        goto = [dict(edges) for edges in self._goto]
+        fail, out, lengths = self._fail, self._out, [len(p) for p in self.patterns]
+        node = 0
+        for i, c in enumerate(text):
+            nxt = goto[node].get(c)
+            if nxt is None:
+                # Resolve through the failure links and memoize the result as a direct edge
+                state = fail[node]
+                while state and c not in goto[state]:
+                    state = fail[state]
+                nxt = goto[node][c] = goto[state].get(c, 0) if node else 0
+            node = nxt
+            if out[node]:
+                for index in out[node]:
+                    yield i + 1 - lengths[index], i + 1, index
+
+
+def _find_each(text, patterns):
+    """Yields (start, end, pattern_index) for every match in `text`, scanning once per distinct pattern."""
+    indexes = {}
+    for index, pattern in enumerate(patterns):
+        if pattern:
+            indexes.setdefault(pattern, []).append(index)
+    for pattern, same in indexes.items():
+        start = text.find(pattern)
+        while start != -1:
+            for index in same:
+                yield start, start + len(pattern), index
+            start = text.find(pattern, start + 1)
+
+
+def locate_passages(text, passages):
+    """
+    Finds each passage in `text`, tolerating differences in whitespace, quote style and case.
+    Returns, per passage, the list of (start, end) offsets of its occurrences in the original text.
+    """
+    normalized, offsets = normalized_view(text)
+    patterns = [normalize_passage(p) for p in passages]
+    if len(patterns) * len(normalized) <= _FIND_WORK_LIMIT:
+        matches = _find_each(normalized, patterns)
+    else:
+        matches = PassageMatcher(patterns).find_all(normalized)
+    found = [[] for _ in passages]
+    for start, end, index in matches:
+        found[index].append((offsets[start], offsets[end - 1] + 1))
+    return found
+
+
+def select_spans(candidates):
+    """
+    Picks non-overlapping spans from (start, end, span) candidates: earlier spans win, longer
+    ones break ties, and each span is used at most once (at its first free occurrence).
+    """
+    chosen, used = [], set()
+    last_end = 0
+    for start, end, span in sorted(candidates, key=lambda c: (c[0], -(c[1] - c[0]))):
+        if id(span) in used or start < last_end:
+            continue
+        chosen.append((start, end, span))
+        used.add(id(span))
+        last_end = end
+    return chosen
+
+
+def render_span(span, passage):
+    reason = html.escape(span["reason"])
+    escaped_passage = html.escape(passage)
+    if span["type"] == "bias":
+        return f'<span class="highlight bias" data-reason="{reason}">{escaped_passage}</span>'
+    verdict = html.escape(span["verdict"].lower())
+    src = span.get("source", "")
+    if "http" in src:
+        return (f'<span class="highlight misinfo {verdict}" data-reason="{reason}">'
+                f'<a href="{html.escape(src)}" target="_blank">{escaped_passage}</a></span>')
+    return f'<span class="highlight misinfo {verdict}" data-reason="{reason}">{escaped_passage}</span>'
+
+
+def apply_combined_highlights(text, bias_passages, misinfo_claims):
+    """Returns `text` as HTML with bias and misinformation passages wrapped in highlight spans."""
+    spans = [
+        {"type": "bias", "passage": b["passage"], "reason": b["reasoning"].strip()}
+        for b in bias_passages
+    ] + [
+        {
+            "type": "misinfo",
+            "passage": m["original-passage"],
+            "verdict": m["verdict"].strip(),
+            "reason": f"{m['verdict']}: {m['justification']}",
+            "source": m.get("source", "").strip()
+        }
+        for m in misinfo_claims
+    ]
+
+    occurrences = locate_passages(text, [span["passage"] for span in spans])
+    candidates = [
+        (start, end, span)
+        for span, found in zip(spans, occurrences)
+        for start, end in found
+    ]
+
+    parts, pos = [], 0
+    for start, end, span in select_spans(candidates):
+        parts.append(html.escape(text[pos:start], quote=False))
+        parts.append(render_span(span, text[start:end]))
+        pos = end
+    parts.append(html.escape(text[pos:], quote=False))
+    return "".join(parts)
+
+
+def apply_edits(text, edits):
+    """
+    Returns `text` with every occurrence of each edit's passage replaced by its replacement.
+    `edits` is a list of (passage, replacement) pairs; overlapping matches are resolved like highlights.
+    """
+    occurrences = locate_passages(text, [passage for passage, _ in edits])
+    candidates = sorted(
+        ((start, end, replacement) for (_, replacement), found in zip(edits, occurrences) for start, end in found),
+        key=lambda c: (c[0], -(c[1] - c[0]))
+    )
+
+    parts, pos = [], 0
+    for start, end, replacement in candidates:
+        if start < pos:
+            continue
+        parts.append(text[pos:start])
+        parts.append(replacement)
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
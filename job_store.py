@@ -0,0 +1,95 @@
+import time
+
+from storage import ensure_schema, get_db, transaction
+
+JOB_RETENTION = 24 * 60 * 60  # progress rows are only needed while someone is waiting on the job
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id         TEXT PRIMARY KEY,
+    done           INTEGER NOT NULL DEFAULT 0,
+    current_step   TEXT NOT NULL,
+    queue_position INTEGER,
+    updated_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at);
+CREATE TABLE IF NOT EXISTS job_sections (
+    job_id     TEXT NOT NULL,
+    section    TEXT NOT NULL,           -- e.g. 'summary', 'unbiased_text'
+    content    TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, section)
+);
+""")
+
+_FIELDS = ("done", "current_step", "queue_position")
+
+
+def create_job(job_id, current_step="Analyzing article..."):
+    get_db().execute(
+        "INSERT OR REPLACE INTO jobs (job_id, done, current_step, updated_at) VALUES (?, 0, ?, ?)",
+        (job_id, current_step, time.time()),
+    )
+
+
+def update_job(job_id, **fields):
+    """Updates any of done / current_step / queue_position for a job."""
+    unknown = set(fields) - set(_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    get_db().execute(
+        f"UPDATE jobs SET {assignments}, updated_at = ? WHERE job_id = ?",
+        (*fields.values(), time.time(), job_id),
+    )
+
+
+def set_queue_positions(job_ids):
+    """Records the 1-based queue position of each waiting job, in queue order."""
+    with transaction() as conn:
+        conn.executemany(
+            "UPDATE jobs SET queue_position = ? WHERE job_id = ?",
+            [(i + 1, job_id) for i, job_id in enumerate(job_ids)],
+        )
+
+
+def get_job(job_id):
+    """Returns the job's progress as a dict, or None if the job is unknown."""
+    row = get_db().execute(
+        "SELECT done, current_step, queue_position FROM jobs WHERE job_id = ?", (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    job = {"done": bool(row["done"]), "current_step": row["current_step"]}
+    if row["queue_position"]:
+        job["queue_position"] = row["queue_position"]
+    sections = get_sections(job_id)
+    if sections:
+        job["sections"] = sections
+    return job
+
+
+def set_section(job_id, section, content):
+    """Stores the partial (or final) text of one result section while the job is running."""
+    get_db().execute(
+        "INSERT OR REPLACE INTO job_sections (job_id, section, content, updated_at) VALUES (?, ?, ?, ?)",
+        (job_id, section, content, time.time()),
+    )
+
+
+def get_sections(job_id):
+    rows = get_db().execute("SELECT section, content FROM job_sections WHERE job_id = ?", (job_id,))
+    return {row["section"]: row["content"] for row in rows}
+
+
+def delete_job(job_id):
+    with transaction() as conn:
+        conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM job_sections WHERE job_id = ?", (job_id,))
+
+
+def purge_old_jobs():
+    cutoff = time.time() - JOB_RETENTION
+    with transaction() as conn:
+        conn.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
+        conn.execute("DELETE FROM job_sections WHERE updated_at < ?", (cutoff,))
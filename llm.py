@@ -0,0 +1,197 @@
+# One gateway for every OpenAI chat call: a pooled AsyncOpenAI client on a background
+# event loop, optional per-model request/token buckets, and retries with jittered backoff.
+# Limits are per gunicorn worker process, so set them to the quota divided by the worker count.
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, RateLimitError
+
+import tracing
+from chunking import count_tokens
+
+LLM_CALL_TIMEOUT = int(os.getenv("LLM_CALL_TIMEOUT", 120))  # seconds per call, including retries and waiting
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 32))
+MAX_ATTEMPTS = 5
+BASE_BACKOFF = 1.0  # seconds; doubled each retry, with jitter
+PARTIAL_FLUSH_INTERVAL = 0.3  # seconds between on_partial calls while streaming
+
+# Deadline of the job the current thread works for; calls give up when it passes
+_job_deadline = contextvars.ContextVar("job_deadline", default=None)
+
+
+@functools.lru_cache(maxsize=None)
+def load_prompt(name):
+    """Reads a system prompt from prompts/ once per process."""
+    with open(os.path.join("prompts", name), "r") as file:
+        return file.read()
+
+
+def _limits(model):
+    """(requests, tokens) per minute for this worker, or None where no limit is configured."""
+    suffix = re.sub(r"[^A-Z0-9]", "_", model.upper())
+    rpm = os.getenv(f"LLM_RPM_{suffix}", os.getenv("LLM_RPM"))
+    tpm = os.getenv(f"LLM_TPM_{suffix}", os.getenv("LLM_TPM"))
+    return (int(rpm) if rpm else None), (int(tpm) if tpm else None)
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """LLM calls made in this context (and in pools given a copy of it) stop at `deadline`."""
+    token = _job_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _job_deadline.reset(token)
+
+
+class TokenBucket:
+    """Refills continuously up to `per_minute`; acquire() waits until enough capacity is available."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount, deadline):
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+                if time.time() + wait > deadline:
+                    raise TimeoutError("Rate limit wait would exceed the deadline.")
+                await asyncio.sleep(wait)
+
+
+class _Gateway:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="llm-gateway", daemon=True).start()
+        self.client = None
+        self.buckets = {}
+        asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result()
+
+    async def _setup(self):
+        # The HTTP client has to be created on the loop that will use it
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,  # retries are handled here, with the shared limiter
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                timeout=httpx.Timeout(LLM_CALL_TIMEOUT, connect=10),
+            ),
+        )
+
+    def _buckets(self, model):
+        if model not in self.buckets:
+            rpm, tpm = _limits(model)
+            self.buckets[model] = (rpm and TokenBucket(rpm), tpm and TokenBucket(tpm))
+        return self.buckets[model]
+
+    async def complete(self, model, messages, on_partial, deadline, kwargs):
+        requests_bucket, tokens_bucket = self._buckets(model)
+        estimate = sum(count_tokens(m["content"]) for m in messages) + kwargs.get("max_tokens", 1000)
+
+        for attempt in range(MAX_ATTEMPTS):
+            if requests_bucket:
+                await requests_bucket.acquire(1, deadline)
+            if tokens_bucket:
+                await tokens_bucket.acquire(estimate, deadline)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError("LLM call deadline exceeded.")
+            try:
+                return await asyncio.wait_for(self._request(model, messages, on_partial, kwargs), remaining)
+            except (RateLimitError, APIConnectionError, APITimeoutError, asyncio.TimeoutError) as e:
+                error = e
+            except APIStatusError as e:
+                if e.status_code < 500:
+                    raise
+                error = e
+            backoff = BASE_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+            if attempt == MAX_ATTEMPTS - 1 or time.time() + backoff >= deadline:
+                raise error
+            print(f"[LLM] {model} call failed ({type(error).__name__}), retrying in {backoff:.1f}s")
+            await asyncio.sleep(backoff)
+
+    async def _request(self, model, messages, on_partial, kwargs):
+        # Returns (text, usage); usage may be None if the API didn't report it
+        if on_partial is None:
+            response = await self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+            return response.choices[0].message.content.strip(), response.usage
+
+        parts = []
+        last_flush = 0
+        usage = None
+        stream = await self.client.chat.completions.create(
+            model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **kwargs
+        )
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                if time.time() - last_flush >= PARTIAL_FLUSH_INTERVAL:
+                    last_flush = time.time()
+                    # Callbacks may block (e.g. database writes); keep them off the event loop
+                    await asyncio.to_thread(on_partial, "".join(parts))
+        output = "".join(parts).strip()
+        await asyncio.to_thread(on_partial, output)
+        return output, usage
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def _get_gateway():
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = _Gateway()
+        return _gateway
+
+
+def deadline_passed():
+    """True once the current job's deadline (if any) has passed."""
+    deadline = _job_deadline.get()
+    return deadline is not None and time.time() >= deadline
+
+
+def chat(model, messages, on_partial=None, timeout=LLM_CALL_TIMEOUT, **kwargs):
+    """
+    Blocking chat completion through the shared gateway; returns the response text.
+    With on_partial, the response is streamed and on_partial(text_so_far) is called
+    every PARTIAL_FLUSH_INTERVAL seconds and once more when it is complete.
+    The call gives up after `timeout` seconds, or earlier at the job's deadline (see deadline_scope).
+    """
+    deadline = time.time() + timeout
+    if _job_deadline.get() is not None:
+        deadline = min(deadline, _job_deadline.get())
+    if deadline <= time.time():
+        raise TimeoutError("The analysis deadline has passed.")
+    gateway = _get_gateway()
+    future = asyncio.run_coroutine_threadsafe(
+        gateway.complete(model, messages, on_partial, deadline, kwargs), gateway.loop
+    )
+    text, usage = future.result()
+    if usage is not None:
+        tracing.record_llm_usage(model, usage.prompt_tokens, usage.completion_tokens)
+    else:
+        tracing.record_llm_usage(model, sum(count_tokens(m["content"]) for m in messages), count_tokens(text))
+    return text
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+
+from storage import ensure_schema, get_db, transaction
+
+# Span metrics are written through to SQLite so /metrics on any worker reports all of them;
+# each worker also publishes its queue/thread/memory gauges there every GAUGE_INTERVAL seconds.
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+GAUGE_INTERVAL = 5  # seconds
+GAUGE_MAX_AGE = 3 * GAUGE_INTERVAL  # gauges of workers that stopped reporting are left out
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS span_metrics (
+    span         TEXT PRIMARY KEY,
+    count        INTEGER NOT NULL DEFAULT 0,
+    errors       INTEGER NOT NULL DEFAULT 0,
+    duration_sum REAL NOT NULL DEFAULT 0,
+    tokens_in    INTEGER NOT NULL DEFAULT 0,
+    tokens_out   INTEGER NOT NULL DEFAULT 0,
+    cost         REAL NOT NULL DEFAULT 0,
+    search_calls INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS span_duration_buckets (
+    span  TEXT NOT NULL,
+    le    TEXT NOT NULL,                -- upper bound of the bucket, or '+Inf'
+    count INTEGER NOT NULL DEFAULT 0,   -- not cumulative; summed when rendering
+    PRIMARY KEY (span, le)
+);
+CREATE TABLE IF NOT EXISTS worker_gauges (
+    pid               INTEGER PRIMARY KEY,
+    queued            INTEGER NOT NULL,
+    queued_background INTEGER NOT NULL,
+    running           INTEGER NOT NULL,
+    threads           INTEGER NOT NULL,
+    rss_bytes         INTEGER NOT NULL,
+    updated_at        REAL NOT NULL
+);
+""")
+
+
+def _bucket(duration):
+    return next((str(le) for le in DURATION_BUCKETS if duration <= le), "+Inf")
+
+
+def observe_span(record):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO span_metrics (span, count, errors, duration_sum, tokens_in, tokens_out, cost, search_calls) "
+            "VALUES (?, 1, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (span) DO UPDATE SET count = count + 1, errors = errors + excluded.errors, "
+            "duration_sum = duration_sum + excluded.duration_sum, tokens_in = tokens_in + excluded.tokens_in, "
+            "tokens_out = tokens_out + excluded.tokens_out, cost = cost + excluded.cost, "
+            "search_calls = search_calls + excluded.search_calls",
+            (record["name"], 1 if record["error"] else 0, record["duration"], record["tokens_in"],
+             record["tokens_out"], record["cost"], record["search_calls"]),
+        )
+        conn.execute(
+            "INSERT INTO span_duration_buckets (span, le, count) VALUES (?, ?, 1) "
+            "ON CONFLICT (span, le) DO UPDATE SET count = count + 1",
+            (record["name"], _bucket(record["duration"])),
+        )
+
+
+def publish_gauges(stats, rss_bytes):
+    """Stores this worker's scheduler stats, thread count and RSS."""
+    get_db().execute(
+        "INSERT OR REPLACE INTO worker_gauges (pid, queued, queued_background, running, threads, rss_bytes, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (os.getpid(), stats["queued"], stats["queued_background"], stats["running"],
+         threading.active_count(), rss_bytes, time.time()),
+    )
+
+
+def _gauge_loop(get_stats, get_rss):
+    while True:
+        try:
+            publish_gauges(get_stats(), get_rss())
+        except Exception as e:
+            print("[Metrics] Could not publish gauges:", e)
+        time.sleep(GAUGE_INTERVAL)
+
+
+_reporter_started = False
+_reporter_lock = threading.Lock()
+
+
+def start_reporter(get_stats, get_rss):
+    global _reporter_started
+    with _reporter_lock:
+        if not _reporter_started:
+            _reporter_started = True
+            threading.Thread(target=_gauge_loop, args=(get_stats, get_rss), name="metrics-reporter",
+                             daemon=True).start()
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def render():
+    """All workers' metrics in the Prometheus text exposition format."""
+    conn = get_db()
+    spans = conn.execute("SELECT * FROM span_metrics ORDER BY span").fetchall()
+    buckets = {}
+    for row in conn.execute("SELECT span, le, count FROM span_duration_buckets"):
+        buckets.setdefault(row["span"], {})[row["le"]] = row["count"]
+    conn.execute("DELETE FROM worker_gauges WHERE updated_at < ?", (time.time() - 10 * GAUGE_MAX_AGE,))
+    workers = conn.execute(
+        "SELECT * FROM worker_gauges WHERE updated_at > ?", (time.time() - GAUGE_MAX_AGE,)
+    ).fetchall()
+
+    lines = [
+        "# HELP newssense_span_duration_seconds Time spent in each traced stage.",
+        "# TYPE newssense_span_duration_seconds histogram",
+    ]
+    for row in spans:
+        cumulative = 0
+        for le in [str(b) for b in DURATION_BUCKETS] + ["+Inf"]:
+            cumulative += buckets.get(row["span"], {}).get(le, 0)
+            lines.append(f"newssense_span_duration_seconds_bucket{_labels(span=row['span'], le=le)} {cumulative}")
+        lines.append(f"newssense_span_duration_seconds_sum{_labels(span=row['span'])} {row['duration_sum']}")
+        lines.append(f"newssense_span_duration_seconds_count{_labels(span=row['span'])} {row['count']}")
+
+    counters = (
+        ("newssense_span_errors_total", "errors", "Traced stages that raised."),
+        ("newssense_llm_input_tokens_total", "tokens_in", "LLM input tokens by stage."),
+        ("newssense_llm_output_tokens_total", "tokens_out", "LLM output tokens by stage."),
+        ("newssense_llm_cost_dollars_total", "cost", "Estimated LLM cost by stage."),
+        ("newssense_search_calls_total", "search_calls", "Google Custom Search requests by stage."),
+    )
+    for name, column, help_text in counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f"{name}{_labels(span=row['span'])} {row[column]}" for row in spans]
+
+    gauges = (
+        ("newssense_jobs_queued", "queued", "Analyses waiting in the queue."),
+        ("newssense_background_jobs_queued", "queued_background", "Background analyses waiting."),
+        ("newssense_jobs_running", "running", "Analyses running."),
+        ("newssense_threads", "threads", "Threads in the worker processes."),
+        ("newssense_rss_bytes", "rss_bytes", "Resident memory of the worker processes."),
+    )
+    for name, column, help_text in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f"{name}{_labels(pid=row['pid'])} {row[column]}" for row in workers]
+    lines += ["# HELP newssense_workers Worker processes reporting.", "# TYPE newssense_workers gauge",
+              f"newssense_workers {len(workers)}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,121 @@
+import json
+import os
+import re
+import time
+
+from analysis_cache import article_key, normalize_url
+from chunking import split_into_chunks
+from highlights import normalize_passage
+from storage import ensure_schema, get_db, transaction
+
+# Per-paragraph bias and claim results, so a re-submitted article with a few edited
+# paragraphs only sends those paragraphs back to the model. Results are keyed by the
+# article's URL as well, so a paragraph quoted in another article is analyzed afresh.
+PARAGRAPH_CACHE_TTL = int(os.getenv("PARAGRAPH_CACHE_TTL", 24 * 60 * 60))
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS paragraph_results (
+    paragraph_key TEXT NOT NULL,        -- article_key() of the source URL and the paragraph
+    kind          TEXT NOT NULL,        -- 'bias' or 'claims'
+    data          TEXT NOT NULL,        -- JSON
+    created_at    REAL NOT NULL,
+    PRIMARY KEY (paragraph_key, kind)
+);
+CREATE INDEX IF NOT EXISTS paragraph_results_created_at ON paragraph_results (created_at);
+""")
+
+
+def split_paragraphs(text):
+    return [p for p in re.split(r"\s*\n\s*", text) if p.strip()]
+
+
+def paragraph_keys(paragraphs, source_url):
+    source = normalize_url(source_url)
+    return [article_key(f"{source}\n{p}") for p in paragraphs]
+
+
+def load_results(keys, kind):
+    """Returns {paragraph_key: result} for the keys that have a fresh result of this kind."""
+    keys = list(set(keys))
+    found = {}
+    conn = get_db()
+    for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+        batch = keys[i:i + 500]
+        rows = conn.execute(
+            f"SELECT paragraph_key, data FROM paragraph_results "
+            f"WHERE kind = ? AND created_at > ? AND paragraph_key IN ({','.join('?' * len(batch))})",
+            (kind, time.time() - PARAGRAPH_CACHE_TTL, *batch),
+        ).fetchall()
+        found.update((row["paragraph_key"], json.loads(row["data"])) for row in rows)
+    return found
+
+
+def save_results(results, kind):
+    """Stores {paragraph_key: result} and drops expired entries."""
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO paragraph_results (paragraph_key, kind, data, created_at) VALUES (?, ?, ?, ?)",
+            [(key, kind, json.dumps(result), now) for key, result in results.items()],
+        )
+        conn.execute("DELETE FROM paragraph_results WHERE created_at < ?", (now - PARAGRAPH_CACHE_TTL,))
+
+
+def chunk_paragraphs(paragraphs, max_tokens):
+    """
+    Packs {paragraph_key: text} into split_into_chunks chunks and returns [(chunk, [keys])]
+    with the paragraphs each chunk holds. A paragraph split across chunks is listed in each.
+    """
+    chunks = split_into_chunks("\n\n".join(paragraphs.values()), max_tokens)
+    # Chunks keep every word in order, so word offsets place each paragraph
+    bounds, total = [], 0
+    for chunk in chunks:
+        bounds.append((total, total + len(chunk.split())))
+        total = bounds[-1][1]
+    members = [[] for _ in chunks]
+    start = 0
+    for key, paragraph in paragraphs.items():
+        end = start + len(paragraph.split())
+        for i, (chunk_start, chunk_end) in enumerate(bounds):
+            if chunk_start < end and start < chunk_end:
+                members[i].append(key)
+        start = end
+    return list(zip(chunks, members))
+
+
+def analyze_incrementally(text, source_url, kind, analyze, merge, storable=None):
+    """
+    Runs analyze({key: paragraph}) only on the paragraphs of this URL's article with no stored
+    result of this kind; it returns {key: result}. All paragraphs' results are then merged
+    with merge(results, paragraphs). Only results passing storable(result), if given, are
+    stored for later submissions.
+    """
+    paragraphs = split_paragraphs(text) or [text]
+    keys = paragraph_keys(paragraphs, source_url)
+    known = load_results(keys, kind)
+
+    missing = {}
+    for paragraph, key in zip(paragraphs, keys):
+        if key not in known:
+            missing.setdefault(key, paragraph)
+    if missing:
+        print(f"[Incremental] {kind}: analyzing {len(missing)} of {len(paragraphs)} paragraphs")
+        fresh = analyze(missing)
+        save_results({key: result for key, result in fresh.items() if storable is None or storable(result)}, kind)
+        known.update(fresh)
+    return merge([known[key] for key in keys], paragraphs)
+
+
+def assign_to_paragraphs(items, paragraphs, passage_of):
+    """
+    Groups items (biased passages, claims) by the paragraph their passage comes from.
+    `paragraphs` is {paragraph_key: text}; items found in none go to the first paragraph.
+    """
+    normalized = {key: normalize_passage(text) for key, text in paragraphs.items()}
+    assigned = {key: [] for key in paragraphs}
+    first = next(iter(paragraphs))
+    for item in items:
+        passage = normalize_passage(passage_of(item))
+        target = next((key for key, text in normalized.items() if passage in text), first)
+        assigned[target].append(item)
+    return assigned
@@ -0,0 +1,90 @@
+import concurrent.futures
+import contextvars
+import time
+from collections import namedtuple
+
+# A pipeline stage: func is called with the values of `inputs` (initial values or
+# outputs of other stages, by name) and its return value becomes the output `name`.
+# `step` is the progress message shown while it runs.
+Stage = namedtuple("Stage", ["name", "func", "inputs", "step"])
+
+
+def run_stages(stages, initial, executor, deadline, on_progress=None):
+    """
+    Runs `stages` on `executor`, starting each one as soon as all of its inputs are ready.
+    on_progress(running_stages) is called whenever a stage starts or finishes.
+    Returns (outputs, timings); timings is a list of per-stage dicts with start/end
+    offsets in seconds and each stage's share of the critical path.
+    Raises TimeoutError if `deadline` passes, or the first stage's exception.
+    Stages that haven't started by then are cancelled; running ones can't be interrupted,
+    so their work has to observe the deadline itself (LLM calls do, see llm.deadline_scope).
+    """
+    values = dict(initial)
+    pending = list(stages)
+    running = {}
+    started_at, ended_at = {}, {}
+    t0 = time.time()
+
+    def report():
+        if on_progress:
+            on_progress(sorted(running.values(), key=lambda s: started_at[s.name]))
+
+    try:
+        while pending or running:
+            ready = [s for s in pending if all(name in values for name in s.inputs)]
+            for stage in ready:
+                pending.remove(stage)
+                started_at[stage.name] = time.time()
+                # Each stage runs in a copy of the caller's context (e.g. the job's trace)
+                future = executor.submit(
+                    contextvars.copy_context().run, stage.func, *[values[name] for name in stage.inputs]
+                )
+                running[future] = stage
+            if ready:
+                report()
+            if not running:
+                missing = {name for s in pending for name in s.inputs if name not in values}
+                raise ValueError(f"Pipeline inputs never become available: {', '.join(sorted(missing))}")
+
+            done, _ = concurrent.futures.wait(
+                running, timeout=max(0, deadline - time.time()), return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            if not done:
+                raise TimeoutError("Analysis took too long. Please try a shorter article.")
+            for future in done:
+                stage = running.pop(future)
+                ended_at[stage.name] = time.time()
+                values[stage.name] = future.result()
+            report()
+    finally:
+        for future in running:
+            future.cancel()
+
+    outputs = {s.name: values[s.name] for s in stages}
+    return outputs, _stage_timings(stages, t0, started_at, ended_at)
+
+
+def _stage_timings(stages, t0, started_at, ended_at):
+    # Walk back from the stage that finished last, always through the input that was
+    # ready last: that chain is what determined the total time.
+    by_name = {s.name: s for s in stages}
+    total = max(ended_at.values()) - t0 if ended_at else 0
+    critical = set()
+    current = max(ended_at, key=ended_at.get) if ended_at else None
+    while current:
+        critical.add(current)
+        parents = [name for name in by_name[current].inputs if name in by_name]
+        current = max(parents, key=ended_at.get) if parents else None
+
+    timings = []
+    for stage in stages:
+        start, end = started_at[stage.name] - t0, ended_at[stage.name] - t0
+        share = (end - start) / total if stage.name in critical and total else 0
+        timings.append({
+            "stage": stage.name,
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "duration": round(end - start, 3),
+            "critical_share": round(share, 3),
+        })
+    return timings
@@ -0,0 +1,59 @@
+import os
+import time
+
+import analysis_cache
+from storage import ensure_schema, get_db, transaction
+
+PREANALYZE_HEADLINES = os.getenv("PREANALYZE_HEADLINES", "0") == "1"
+PREANALYZE_CONCURRENCY = int(os.getenv("PREANALYZE_CONCURRENCY", 1))  # background analyses running at once, per worker
+# A count of background analyses per UTC day across all workers, not of tokens or dollars
+PREANALYZE_DAILY_BUDGET = int(os.getenv("PREANALYZE_DAILY_BUDGET", 40))
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS preanalysis_budget (
+    day  TEXT PRIMARY KEY,
+    used INTEGER NOT NULL
+);
+""")
+
+
+def _today():
+    return time.strftime("%Y-%m-%d", time.gmtime())
+
+
+def reserve_budget():
+    """Takes one analysis from today's budget; False if it is used up. Atomic across workers."""
+    with transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO preanalysis_budget (day, used) VALUES (?, 0)", (_today(),))
+        conn.execute("DELETE FROM preanalysis_budget WHERE day < ?", (_today(),))
+        cursor = conn.execute(
+            "UPDATE preanalysis_budget SET used = used + 1 WHERE day = ? AND used < ?",
+            (_today(), PREANALYZE_DAILY_BUDGET),
+        )
+        return cursor.rowcount == 1
+
+
+def refund_budget():
+    """Returns a reserved analysis that never ran (not queued, or taken over by a user's submission)."""
+    get_db().execute("UPDATE preanalysis_budget SET used = used - 1 WHERE day = ? AND used > 0", (_today(),))
+
+
+def preanalyze_headlines(articles, analyze_url, is_available=None):
+    """
+    Speculatively analyzes feed articles that haven't been analyzed yet, within the daily budget.
+    analyze_url(url) should queue a low-priority analysis and return True if it started a new one.
+    """
+    for article in articles:
+        url = article["url"]
+        if analysis_cache.find_url_job(url, is_available):
+            continue
+        if not reserve_budget():
+            print("[Preanalysis] Daily budget used up")
+            return
+        try:
+            if analyze_url(url):
+                print(f"[Preanalysis] Queued {url}")
+                continue
+        except Exception as e:
+            print(f"[Preanalysis] Skipped {url}:", e)
+        refund_budget()
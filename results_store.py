@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import random
+import time
+import zlib
+
+from storage import ensure_schema, get_db, transaction
+
+RESULTS_TTL = int(os.getenv("RESULTS_TTL", 30 * 24 * 60 * 60))
+RESULTS_MAX_ENTRIES = int(os.getenv("RESULTS_MAX_ENTRIES", 200000))
+EVICT_PROBABILITY = 0.01  # evict on ~1 in 100 saves rather than on every one
+LEGACY_RESULTS_DIR = "results"  # one JSON file per job, written by older versions; imported once at startup
+
+ensure_schema("""
+CREATE TABLE IF NOT EXISTS articles (
+    article_key TEXT PRIMARY KEY,       -- sha256 of the exact original text
+    body        BLOB NOT NULL           -- zlib-compressed original text
+);
+CREATE TABLE IF NOT EXISTS results (
+    job_id      TEXT PRIMARY KEY,
+    article_key TEXT,                   -- NULL for error results
+    created_at  REAL NOT NULL,
+    data        BLOB NOT NULL           -- zlib-compressed JSON of everything but original_text
+);
+CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at);
+CREATE INDEX IF NOT EXISTS results_article_key ON results (article_key);
+""")
+
+
+def _zdict(original):
+    # The highlighted and unbiased texts are near-copies of the article, so the article
+    # itself makes an excellent preset dictionary (zlib uses at most the last 32 KB).
+    return original.encode("utf-8")[-32768:]
+
+
+def save_result(job_id, result, created_at=None):
+    result = dict(result)
+    original = result.pop("original_text", None)
+    now = created_at or time.time()
+    with transaction() as conn:
+        article_key = None
+        if original is not None:
+            article_key = hashlib.sha256(original.encode("utf-8")).hexdigest()
+            conn.execute(
+                "INSERT OR IGNORE INTO articles (article_key, body) VALUES (?, ?)",
+                (article_key, zlib.compress(original.encode("utf-8"), 6)),
+            )
+            compressor = zlib.compressobj(6, zdict=_zdict(original))
+        else:
+            compressor = zlib.compressobj(6)
+        data = compressor.compress(json.dumps(result, ensure_ascii=False).encode("utf-8")) + compressor.flush()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (job_id, article_key, created_at, data) VALUES (?, ?, ?, ?)",
+            (job_id, article_key, now, data),
+        )
+        if random.random() < EVICT_PROBABILITY:
+            _evict(conn, now)
+
+
+def load_result(job_id):
+    """Returns the saved result dict for a job, or None if there is none."""
+    row = get_db().execute(
+        "SELECT r.data, a.body FROM results r LEFT JOIN articles a ON a.article_key = r.article_key "
+        "WHERE r.job_id = ?",
+        (job_id,),
+    ).fetchone()
+    if row is None:
+        return None
+
+    if row["body"] is None:
+        return json.loads(zlib.decompress(row["data"]))
+    original = zlib.decompress(row["body"]).decode("utf-8")
+    decompressor = zlib.decompressobj(zdict=_zdict(original))
+    result = json.loads(decompressor.decompress(row["data"]) + decompressor.flush())
+    result["original_text"] = original
+    return result
+
+
+def has_result(job_id):
+    row = get_db().execute("SELECT 1 FROM results WHERE job_id = ?", (job_id,)).fetchone()
+    return row is not None
+
+
+def import_legacy_results():
+    """
+    Moves the per-job JSON files of older versions into the results table, then renames the
+    directory so it is not read again. Lookups only ever hit the table.
+    """
+    try:
+        names = os.listdir(LEGACY_RESULTS_DIR)
+    except OSError:
+        return
+    imported = 0
+    for name in names:
+        path = os.path.join(LEGACY_RESULTS_DIR, name)
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            save_result(name[:-len(".json")], result, created_at=os.path.getmtime(path))
+            imported += 1
+        except (OSError, ValueError) as e:
+            # Another worker may have finished the import and renamed the directory
+            print(f"[Results] Could not import {path}:", e)
+    try:
+        os.rename(LEGACY_RESULTS_DIR, LEGACY_RESULTS_DIR + ".imported")
+    except OSError:
+        pass
+    print(f"[Results] Imported {imported} results from {LEGACY_RESULTS_DIR}/")
+
+
+def _evict(conn, now):
+    conn.execute("DELETE FROM results WHERE created_at < ?", (now - RESULTS_TTL,))
+    cutoff = conn.execute(
+        "SELECT created_at FROM results ORDER BY created_at DESC LIMIT 1 OFFSET ?", (RESULTS_MAX_ENTRIES,)
+    ).fetchone()
+    if cutoff:
+        conn.execute("DELETE FROM results WHERE created_at <= ?", (cutoff["created_at"],))
+    conn.execute(
+        "DELETE FROM articles WHERE NOT EXISTS "
+        "(SELECT 1 FROM results WHERE results.article_key = articles.article_key)"
+    )
+
+
+import_legacy_results()
@@ -0,0 +1,111 @@
+import collections
+import contextvars
+import math
+import threading
+import time
+
+
+class QueueFullError(Exception):
+    """Raised by JobScheduler.submit when no more jobs can be queued."""
+
+    def __init__(self, retry_after):
+        super().__init__("The analysis queue is full.")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    Fixed pool of worker threads fed from a bounded FIFO queue.
+    Background jobs wait in a separate queue, only run when no regular job is
+    waiting, and never occupy more than `background_limit` workers.
+    Each job is called as func(*args, deadline=...) where deadline is an absolute
+    time.time() by which it should give up (measured from submission, so time
+    spent waiting in the queue counts), in a copy of the submitter's context.
+    on_queue_change, if given, is called with the waiting job ids (in order)
+    whenever the queue changes.
+    """
+
+    def __init__(self, workers=2, max_queue=20, job_timeout=180, on_queue_change=None, background_limit=1):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.on_queue_change = on_queue_change
+        self.background_limit = background_limit
+        self._queue = collections.deque()
+        self._background = collections.deque()
+        self._cond = threading.Condition()
+        self._running = 0
+        self._running_background = 0
+        self._avg_duration = 60.0  # seconds; refined as jobs finish
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, job_id, func, *args, background=False, timeout=None):
+        """Queues func; `timeout` overrides job_timeout for jobs expected to take longer."""
+        timeout = timeout or self.job_timeout
+        with self._cond:
+            queue = self._background if background else self._queue
+            if len(queue) >= self.max_queue:
+                raise QueueFullError(self._estimate_wait(len(queue)))
+            # Background jobs may wait a long time; their clock starts when they run
+            deadline = None if background else time.time() + timeout
+            queue.append((job_id, func, args, deadline, timeout, contextvars.copy_context()))
+            self._cond.notify_all()
+            if not background:
+                self._notify_queue_change()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "queued_background": len(self._background),
+                "running": self._running,
+                "running_background": self._running_background,
+                "workers": self.workers,
+            }
+
+    def _notify_queue_change(self):
+        # Called with the lock held so listeners see queue states in order
+        if self.on_queue_change:
+            try:
+                self.on_queue_change([entry[0] for entry in self._queue])
+            except Exception as e:
+                print("[Scheduler] Queue change callback failed:", e)
+
+    def _estimate_wait(self, jobs_ahead):
+        return max(5, math.ceil(self._avg_duration * (jobs_ahead + 1) / self.workers))
+
+    def _next_job(self):
+        # Called with the lock held; returns (entry, is_background) or None
+        if self._queue:
+            entry = self._queue.popleft()
+            self._notify_queue_change()
+            return entry, False
+        if self._background and self._running_background < self.background_limit:
+            return self._background.popleft(), True
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                (job_id, func, args, deadline, timeout, context), background = job
+                self._running += 1
+                self._running_background += background
+
+            started = time.time()
+            deadline = deadline or started + timeout
+            try:
+                context.run(func, *args, deadline=deadline)
+            except Exception as e:
+                print(f"[Scheduler] Job {job_id} failed:", e)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._running_background -= background
+                    # A background slot may have opened up for a waiting worker
+                    self._cond.notify_all()
+                    self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.time() - started)
@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# One SQLite file shared by every gunicorn worker on the machine
+DB_PATH = os.getenv("NEWSSENSE_DB", os.path.join("data", "newssense.db"))
+
+_local = threading.local()
+
+
+def get_db():
+    """Returns this thread's connection to the shared database (opened lazily in WAL mode)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+
+def ensure_schema(ddl):
+    """Creates the tables/indexes in `ddl` if they don't exist yet."""
+    get_db().executescript(ddl)
+
+
+@contextmanager
+def transaction():
+    """Write transaction that takes the database lock up front so read-modify-write is atomic across workers."""
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# storage opens NEWSSENSE_DB on import, so point it at a scratch database before any test imports it
+os.environ["NEWSSENSE_DB"] = os.path.join(tempfile.mkdtemp(prefix="newssense-tests-"), "newssense.db")
@@ -0,0 +1,20 @@
+import highlights
+
+TEXT = "The  “terrible” policy failed. Officials said the terrible policy would return."
+PASSAGES = ['the "terrible" policy', "terrible policy", "policy", "not in the text"]
+
+
+def test_find_and_automaton_paths_agree(monkeypatch):
+    by_find = highlights.locate_passages(TEXT, PASSAGES)
+    monkeypatch.setattr(highlights, "_FIND_WORK_LIMIT", 0)
+    assert highlights.locate_passages(TEXT, PASSAGES) == by_find
+    assert [TEXT[start:end] for start, end in by_find[0]] == ["The  “terrible” policy"]
+    assert len(by_find[2]) == 2 and by_find[3] == []
+
+
+def test_find_all_leaves_matcher_unchanged():
+    matcher = highlights.PassageMatcher(["he", "she", "his", "hers"])
+    edges = [dict(node) for node in matcher._goto]
+    first = list(matcher.find_all("ushers and his shed"))
+    assert matcher._goto == edges
+    assert list(matcher.find_all("ushers and his shed")) == first
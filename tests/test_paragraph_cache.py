@@ -0,0 +1,60 @@
+import paragraph_cache
+
+ARTICLE = [
+    "The council passed the budget on Monday after a long debate.",
+    "Critics called the plan a reckless giveaway to developers.",
+    "The mayor said spending would rise 5% next year.",
+]
+
+
+def analyze_recording(sent):
+    def analyze(paragraphs):
+        sent.append(list(paragraphs.values()))
+        return {key: [text] for key, text in paragraphs.items()}
+    return analyze
+
+
+def merge(results, paragraphs):
+    return [item for result in results for item in result]
+
+
+def test_edit_resends_only_changed_paragraph():
+    sent = []
+    url = "https://example.com/news/budget"
+    first = paragraph_cache.analyze_incrementally("\n\n".join(ARTICLE), url, "test", analyze_recording(sent), merge)
+    assert first == ARTICLE
+    assert sent == [ARTICLE]
+
+    edited = ARTICLE[:1] + ["Critics called the plan a generous deal for developers."] + ARTICLE[2:]
+    second = paragraph_cache.analyze_incrementally("\n\n".join(edited), url, "test", analyze_recording(sent), merge)
+    assert second == edited
+    assert sent[1] == [edited[1]]
+
+
+def test_results_are_scoped_to_source_url():
+    sent = []
+    text = "\n\n".join(ARTICLE)
+    paragraph_cache.analyze_incrementally(text, "https://example.com/a", "scoped", analyze_recording(sent), merge)
+    paragraph_cache.analyze_incrementally(text, "https://other.example.org/b", "scoped", analyze_recording(sent), merge)
+    assert sent == [ARTICLE, ARTICLE]
+
+
+def test_unstorable_results_are_analyzed_again():
+    sent = []
+    url = "https://example.com/news/failed"
+    for _ in range(2):
+        paragraph_cache.analyze_incrementally("\n\n".join(ARTICLE), url, "failing", analyze_recording(sent), merge,
+                                              storable=lambda result: "5%" not in result[0])
+    assert sent == [ARTICLE, ARTICLE[2:]]
+
+
+def test_chunk_paragraphs_lists_the_paragraphs_in_each_chunk():
+    paragraphs = {f"p{i}": text for i, text in enumerate(ARTICLE)}
+    assert paragraph_cache.chunk_paragraphs(paragraphs, 1500) == [("\n\n".join(ARTICLE), ["p0", "p1", "p2"])]
+
+    # Tiny chunks split paragraphs; each piece must be listed under the paragraphs it came from
+    packed = paragraph_cache.chunk_paragraphs(paragraphs, 5)
+    assert len(packed) > len(paragraphs)
+    for chunk, keys in packed:
+        assert " ".join(chunk.split()) in " ".join(paragraphs[key] for key in keys)
+    assert {key for _, keys in packed for key in keys} == set(paragraphs)
@@ -0,0 +1,131 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+import metrics
+
+# USD per million (input, output) tokens, for the cost estimate on each span
+MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (2.5, 10.0),
+}
+
+# The job being traced and the innermost open span. Work handed to thread pools must run
+# in a copy of the submitter's context (see submit) to be attributed to the right span.
+_trace = contextvars.ContextVar("trace", default=None)
+_span = contextvars.ContextVar("span", default=None)
+_lock = threading.Lock()
+
+
+def rss_bytes():
+    return psutil.Process().memory_info().rss
+
+
+class Trace:
+    """The finished spans of one job, in the order they ended."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._spans = []
+
+    def add(self, record):
+        with _lock:
+            self._spans.append(record)
+
+    def records(self):
+        with _lock:
+            return list(self._spans)
+
+
+class Span:
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.cost = 0.0
+        self.search_calls = 0
+
+    def add(self, tokens_in=0, tokens_out=0, cost=0.0, search_calls=0):
+        # Chunk and claim calls from several threads can report into the same span
+        with _lock:
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+            self.cost += cost
+            self.search_calls += search_calls
+
+
+@contextmanager
+def activate(trace):
+    """Makes `trace` the one that spans opened in this context are saved to."""
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def current_trace():
+    return _trace.get()
+
+
+@contextmanager
+def span(name):
+    """
+    Times the enclosed work and records the LLM tokens, cost and searches it reports, plus the
+    change in this process's RSS. The record goes to the current trace (if any) and to /metrics.
+    """
+    parent = _span.get()
+    current = Span(name, parent.name if parent else None)
+    token = _span.set(current)
+    started, rss_before = time.time(), rss_bytes()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _span.reset(token)
+        trace = _trace.get()
+        record = {
+            "name": name,
+            "parent": current.parent,
+            "start": round(started - (trace.started if trace else started), 3),
+            "duration": round(time.time() - started, 3),
+            "tokens_in": current.tokens_in,
+            "tokens_out": current.tokens_out,
+            "cost": round(current.cost, 6),
+            "search_calls": current.search_calls,
+            "rss_delta_mb": round((rss_bytes() - rss_before) / 1024 ** 2, 2),
+            "error": error,
+        }
+        if trace:
+            trace.add(record)
+        try:
+            metrics.observe_span(record)
+        except Exception as e:
+            print("[Tracing] Could not record metrics:", e)
+
+
+def record_llm_usage(model, tokens_in, tokens_out):
+    current = _span.get()
+    if current is None:
+        return
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    current.add(tokens_in=tokens_in, tokens_out=tokens_out,
+                cost=(tokens_in * price_in + tokens_out * price_out) / 1_000_000)
+
+
+def record_search_call():
+    current = _span.get()
+    if current is not None:
+        current.add(search_calls=1)
+
+
+def submit(executor, func, *args):
+    """executor.submit that runs func in a copy of the current context, so its usage lands in the current span."""
+    return executor.submit(contextvars.copy_context().run, func, *args)